@@ -18,6 +18,7 @@ from egazette.ocr.djvuxml import Djvu
 from egazette.ocr.abbyxml import Abby
 from egazette.ocr.hocr import HOCR
 from egazette.ocr.htmlmaker import HtmlMaker
+from egazette.utils.retry_queue import RetryQueue, RetryLater
 import internetarchive 
 from internetarchive import download, upload, get_session, modify_metadata
 
@@ -471,15 +472,13 @@ class IA:
         return zfiles        
 
     def download_jp2(self, item, glob_pattern):
-        success = False
-        while not success:
-            try:
-                download(item, glob_pattern=glob_pattern, destdir=self.top_dir,\
-                         ignore_existing = True, retries = 10)
-                success = True         
-            except Exception as e:
-                success = False
-                time.sleep(60)
+        try:
+            download(item, glob_pattern=glob_pattern, destdir=self.top_dir,\
+                     ignore_existing = True, retries = 10)
+        except Exception as e:
+            self.logger.warning('Error in downloading %s from %s: %s', \
+                                glob_pattern, item, e)
+            raise RetryLater(e)
 
     def is_exist(self, item):
         item_path = os.path.join(self.top_dir, item)
@@ -489,13 +488,20 @@ class IA:
 
     def fetch_jp2(self, item, jp2_filter):
         item_path = os.path.join(self.top_dir, item)
-        if jp2_filter:
-            for f in jp2_filter:
-                self.download_jp2(item, '%s*_jpg.zip' % f)
-                self.download_jp2(item, '%s*_jp2.zip' % f)
-        else:        
-            self.download_jp2(item, '*_jp2.zip')
-            self.download_jp2(item, '*_jpg.zip')
+        existed   = os.path.exists(item_path)
+        try:
+            if jp2_filter:
+                for f in jp2_filter:
+                    self.download_jp2(item, '%s*_jpg.zip' % f)
+                    self.download_jp2(item, '%s*_jp2.zip' % f)
+            else:        
+                self.download_jp2(item, '*_jp2.zip')
+                self.download_jp2(item, '*_jpg.zip')
+        except RetryLater:
+            # a partial item dir would make the retry think it is processed
+            if not existed:
+                shutil.rmtree(item_path, ignore_errors = True)
+            raise
                 
         if not os.path.exists(item_path):
             self.logger.warning('Item path does not exist: %s', item_path)
@@ -894,10 +900,16 @@ if __name__ == '__main__':
     else:
         ia = IA(top_dir, access_key, secret_key, leveldict[loglevel], \
                 logfile, update_lang)
+        # items whose download failed are retried while others get processed
+        retries = RetryQueue(60, 3600, 10)
         if ia_item:
-            process_item(client, ia, ia_item, jp2_filter, out_format, update, ppi)
+            retries.submit(process_item, (client, ia, ia_item, jp2_filter, \
+                                          out_format, update, ppi))
         elif ia_item_file:
             for ia_item in ia_item_file:
                 ia_item = ia_item.strip()
-                process_item(client, ia, ia_item, jp2_filter, out_format, update, ppi)
+                retries.submit(process_item, (client, ia, ia_item, jp2_filter, \
+                                              out_format, update, ppi))
+                retries.run_ready()
+        retries.drain()
         
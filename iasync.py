@@ -16,6 +16,7 @@ from egazette.utils.file_storage import FileManager
 from egazette.utils import reporting
 from egazette.utils import utils
 from egazette.utils import pdf_ops
+from egazette.utils.retry_queue import RetryQueue, RetryLater
 from egazette.gvision import get_google_client, to_hocr, pdf_to_jpg, compress_file, LangTags
 from egazette.srcs import datasrcs_info
 
@@ -27,12 +28,17 @@ class Stats:
         self.modify = {}
         self.modify_success = {}
 
+        self.duplicates = {}
+
     def update_upload(self, srcname, success):    
         self.update(srcname, success, self.uploads, self.upload_success)
 
     def update_modify(self, srcname, success):    
         self.update(srcname, success, self.modify, self.modify_success)
 
+    def update_duplicate(self, srcname):
+        self.duplicates[srcname] = self.duplicates.get(srcname, 0) + 1
+
     def update(self, srcname, success, total, total_success):
         if srcname not in total:
             total[srcname]         = 0
@@ -61,10 +67,19 @@ class Stats:
         if self.modify:    
             msg.append('Modify Stats')
             self.get_msg_by_srcs(msg, self.modify, self.modify_success)
+
+        if self.duplicates:
+            msg.append('Skipped as already uploaded')
+            msg.append('------------')
+            msg.append('Srcname\tTotal')
+            for srcname in sorted(self.duplicates.keys()):
+                msg.append('%s\t%d' % (srcname, self.duplicates[srcname]))
+            msg.append('\n')
         
         noupdate = []
         for src in srcnames:
-            if src not in self.uploads and src not in self.modify:
+            if src not in self.uploads and src not in self.modify and \
+                    src not in self.duplicates:
                 noupdate.append(src)
         if noupdate:
              msg.append('No updates from %s' % ', '.join(noupdate))
@@ -152,6 +167,19 @@ class GazetteIA:
         self.num_upload_retries = 100
         self.num_reattempts = 5
         self.reattempt_delay_secs = 300
+        self.max_reattempt_delay_secs = 3600
+        # momentary errors are retried in place before the item is parked
+        self.num_inplace_attempts = 3
+        self.inplace_delay_secs = 10
+        # a new gazette byte identical to an uploaded one is not uploaded
+        # again, the relurls skipped are kept for the stats
+        self.skip_duplicates = False
+        self.duplicates      = {}
+        # metainfos read ahead in batches for update_meta
+        self.metainfos       = {}
+        # OCR output of uploads parked by the retry queue, reused by the
+        # next attempt as the OCR is paid per page
+        self.ocr_outputs = {}
    
     def get_ia_item(self, identifier):
         try:
@@ -165,7 +193,7 @@ class GazetteIA:
         final = []
         for filepath in to_upload:
             if re.search('pdf$', filepath):
-                jpgzip, hocrzip = self.gvisionobj.convert_to_jpg_hocr(identifier, filepath)
+                jpgzip, hocrzip = self.get_ocr_output(identifier, filepath)
                 if jpgzip:
                     final.append(jpgzip)
                 if hocrzip:
@@ -175,6 +203,24 @@ class GazetteIA:
 
         return final
 
+    def get_ocr_output(self, identifier, filepath):
+        outputs = self.ocr_outputs.get(filepath)
+        if outputs and all(os.path.exists(x) for x in outputs if x):
+            self.logger.info('Reusing the OCR output of %s', filepath)
+            return outputs
+
+        outputs = self.gvisionobj.convert_to_jpg_hocr(identifier, filepath)
+        self.ocr_outputs[filepath] = outputs
+        return outputs
+
+    def remove_ocr_output(self, rawfile):
+        outputs = self.ocr_outputs.pop(rawfile, None)
+        if outputs == None:
+            return
+        for filepath in outputs:
+            if filepath and os.path.exists(filepath):
+                os.remove(filepath)
+
     def get_identifier(self, relurl, metainfo):
         return datasrcs_info.get_identifier(relurl, metainfo)
 
@@ -199,11 +245,9 @@ class GazetteIA:
             return False
         self.update_links(relurl, metainfo)
 
-        while 1:
-            item = self.get_ia_item(identifier)
-            if item:
-                break
-            time.sleep(self.reattempt_delay_secs)
+        item = self.get_ia_item(identifier)
+        if not item:
+            raise RetryLater('could not get item %s' % identifier)
 
         rawfile  = self.file_storage.get_rawfile_path(relurl)
         metafile = self.file_storage.get_metafile_path(relurl)
@@ -229,6 +273,15 @@ class GazetteIA:
                 to_upload.append(metafile)
             metadata = None    
         else: 
+            duplicate = None
+            if self.skip_duplicates:
+                duplicate = self.find_uploaded_duplicate(relurl, identifier)
+            if duplicate:
+                self.logger.info('Rawfile of %s is identical to the one in %s. Ignoring.', \
+                                 relurl, duplicate)
+                self.duplicates[relurl] = duplicate
+                return False
+
             files = set([]) 
             metadata  = self.to_ia_metadata(relurl, metainfo)
             to_upload = [rawfile, metafile]
@@ -244,7 +297,9 @@ class GazetteIA:
             metadata['ocr'] = 'google-cloud-vision IndianKanoon 1.0'
             metadata['fts-ignore-ingestion-lang-filter'] = 'true'
 
+        # on RetryLater the OCR output is left for the next attempt
         success = self.ia_upload(identifier, metadata, to_upload, files)
+        self.ocr_outputs.pop(rawfile, None)
 
         if success:
             self.logger.info('Successfully uploaded %s', identifier)
@@ -257,6 +312,21 @@ class GazetteIA:
 
         return success
 
+    def find_uploaded_duplicate(self, relurl, identifier):
+        for dup_relurl in self.file_storage.get_duplicates(relurl):
+            metainfo = self.file_storage.get_metainfo(dup_relurl)
+            if metainfo == None:
+                continue
+
+            dup_identifier = self.get_identifier(dup_relurl, metainfo)
+            if dup_identifier == None or dup_identifier == identifier:
+                continue
+
+            item = self.get_ia_item(dup_identifier)
+            if item and item.exists:
+                return dup_identifier
+        return None
+
     def pop_rawfile(self, to_upload):
         idx = -1
         for i,file in enumerate(to_upload):
@@ -271,10 +341,11 @@ class GazetteIA:
 
     def ia_upload(self, identifier, metadata, to_upload, files):
         uploaded = False
+        transient = False
         bad_pdf_detected = False
         to_del = []
 
-        count = self.num_reattempts
+        count = self.num_inplace_attempts
         while count > 0:
             try:
                 if metadata:
@@ -339,12 +410,19 @@ class GazetteIA:
             except Exception as e:
                 self.logger.warning('Error in upload for %s: %s', identifier, e)
 
-            count = count - 1 
-            time.sleep(self.reattempt_delay_secs)
+            # anything other than a bad pdf is retried later from the queue
+            # once the attempts in place run out
+            count = count - 1
+            if count == 0:
+                transient = True
+                break
+            time.sleep(self.inplace_delay_secs)
 
         for file in to_del:
             os.remove(file)
 
+        if transient:
+            raise RetryLater('upload failed for %s' % identifier)
         return uploaded
 
 
@@ -474,8 +552,17 @@ class GazetteIA:
        desc_html = '<br/>'.join(['%s: %s' % (d[0], d[1]) for d in desc])
        return '<p>' + desc_html + '</p>'
 
+    def prefetch_metainfos(self, relurls):
+        metainfos = self.file_storage.get_metainfos(relurls)
+        for relurl, metainfo in zip(relurls, metainfos):
+            if metainfo != None:
+                self.metainfos[relurl] = metainfo
+
     def update_meta(self, relurl):
-        metainfo = self.file_storage.get_metainfo(relurl)
+        # a retry reads the metainfo again
+        metainfo = self.metainfos.pop(relurl, None)
+        if metainfo == None:
+            metainfo = self.file_storage.get_metainfo(relurl)
         if metainfo == None:
             self.logger.warning('No metainfo, Ignoring upload for %s' % relurl)
             return False
@@ -483,32 +570,33 @@ class GazetteIA:
         identifier = self.get_identifier(relurl, metainfo)
         self.update_links(relurl, metainfo)
 
-        while 1:
-            item = self.get_ia_item(identifier)
-            if item:
-                break
-            time.sleep(self.reattempt_delay_secs)
+        item = self.get_ia_item(identifier)
+        if not item:
+            raise RetryLater('could not get item %s' % identifier)
 
         if not item.exists:
             return self.upload(relurl)
         else:
             metadata = self.to_ia_metadata(relurl, metainfo)
-            while 1:
-                if self.ia_modify_metadat(identifier, metadata):
-                    break
-                time.sleep(self.reattempt_delay_secs)    
+            if not self.ia_modify_metadat(identifier, metadata):
+                raise RetryLater('could not modify metadata of %s' % identifier)
  
         return True
 
     def ia_modify_metadat(self, identifier, metadata):
-        try:
-            modify_metadata(identifier, metadata = metadata, \
-                            access_key = self.access_key, \
-                            secret_key = self.secret_key)
-        except Exception as e:
-            self.logger.warning('Could not  modify metadata %s. Error %s' , identifier, e)
-            return False
-        return True        
+        count = self.num_inplace_attempts
+        while count > 0:
+            try:
+                modify_metadata(identifier, metadata = metadata, \
+                                access_key = self.access_key, \
+                                secret_key = self.secret_key)
+                return True
+            except Exception as e:
+                self.logger.warning('Could not  modify metadata %s. Error %s' , identifier, e)
+            count = count - 1
+            if count > 0:
+                time.sleep(self.inplace_delay_secs)
+        return False
 
 def print_usage(progname):
     print('Usage: python %s [-l loglevel(critical, error, warn, info, debug)]' % progname + '''
@@ -516,8 +604,11 @@ def print_usage(progname):
                         [-f logfile]
                         [-m (update_meta)]
                         [-u (upload_to_ia)]
+                        [-b (skip gazettes identical to an uploaded one, needs the catalog)]
                         [-r relurl]
                         [-i (relurls_from_stdin)]
+                        [-j consumer (relurls from the change journal since the last run,
+                                     kept per consumer and set of -s sources)]
                         [-d days_to_sync]
                         [-D gazette_directory]
                         [-I internet_archive_directory]
@@ -543,11 +634,53 @@ def handle_relurl(gazette_ia, relurl, to_upload, to_update, stats):
 
     if to_upload:
         success = gazette_ia.upload(relurl)
-        stats.update_upload(srcname, success)
+        if gazette_ia.duplicates.pop(relurl, None) != None:
+            stats.update_duplicate(srcname)
+        else:
+            stats.update_upload(srcname, success)
     elif to_update:
         success = gazette_ia.update_meta(relurl)   
         stats.update_modify(srcname, success)
 
+def record_failure(gazette_ia, relurl, to_upload, to_update, stats):
+    srcname = gazette_ia.get_srcname(relurl)
+
+    if to_upload:
+        if gazette_ia.gvisionobj:
+            rawfile = gazette_ia.file_storage.get_rawfile_path(relurl)
+            gazette_ia.remove_ocr_output(rawfile)
+        stats.update_upload(srcname, False)
+    elif to_update:
+        stats.update_modify(srcname, False)
+
+def queue_relurl(retries, gazette_ia, relurl, to_upload, to_update, stats, \
+                 giveup = record_failure):
+    # failed items wait in the queue while the rest of the relurls proceed
+    retries.submit(handle_relurl, \
+                   (gazette_ia, relurl, to_upload, to_update, stats), \
+                   giveup = giveup)
+    retries.run_ready()
+
+def queue_relurls(retries, gazette_ia, relurls, to_upload, to_update, stats, \
+                  batch_size = 1000):
+    # a metadata refresh reads the metainfos of a batch together
+    batch = []
+    for relurl in relurls:
+        batch.append(relurl)
+        if len(batch) < batch_size:
+            continue
+        queue_batch(retries, gazette_ia, batch, to_upload, to_update, stats)
+        batch = []
+
+    if batch:
+        queue_batch(retries, gazette_ia, batch, to_upload, to_update, stats)
+
+def queue_batch(retries, gazette_ia, relurls, to_upload, to_update, stats):
+    if to_update and not to_upload:
+        gazette_ia.prefetch_metainfos(relurls)
+    for relurl in relurls:
+        queue_relurl(retries, gazette_ia, relurl, to_upload, to_update, stats)
+
 if __name__ == '__main__':
     progname  = sys.argv[0]
     loglevel  = 'info'
@@ -562,6 +695,8 @@ if __name__ == '__main__':
     secret_key = None
     relurls    = []
     from_stdin = False
+    consumer   = None
+    skip_duplicates = False
 
     server_token = None
     from_addr    = None
@@ -569,7 +704,7 @@ if __name__ == '__main__':
     key_file   = None
     iadir      = None
 
-    optlist, remlist = getopt.getopt(sys.argv[1:], 'a:k:d:D:f:g:hiI:l:s:t:T:mr:uE:p:U:')
+    optlist, remlist = getopt.getopt(sys.argv[1:], 'a:bk:d:D:f:g:hiI:j:l:s:t:T:mr:uE:p:U:')
     for o, v in optlist:
         if o == '-l':
             loglevel = v
@@ -598,12 +733,16 @@ if __name__ == '__main__':
             from_addr = v
         elif o == '-a':
             access_key = v    
+        elif o == '-b':
+            skip_duplicates = True
         elif o == '-k':
             secret_key = v    
         elif o == '-r':
             relurls.append(v)    
         elif o == '-i':
             from_stdin = True    
+        elif o == '-j':
+            consumer = v
         elif o == '-E':
             to_addrs.append(v)
         elif o == '-p':
@@ -681,25 +820,66 @@ if __name__ == '__main__':
         )
 
 
-    storage = FileManager(datadir, False, False)
+    storage = FileManager(datadir, False, False, journal = consumer != None)
     gazette_ia = GazetteIA(gvisionobj, storage, access_key, secret_key, loglevel, logfile)
+    gazette_ia.skip_duplicates = skip_duplicates
+    if skip_duplicates and not storage.catalog.is_built():
+        gazette_ia.logger.warning('No catalog in %s, duplicates will not be found', datadir)
     stats        = Stats()
+    retries      = RetryQueue(gazette_ia.reattempt_delay_secs, \
+                              gazette_ia.max_reattempt_delay_secs, \
+                              gazette_ia.num_reattempts)
+
+    if consumer and srcnames:
+        # the offset is of the records of these sources alone
+        consumer = '%s-%s' % (consumer, '+'.join(sorted(srcnames)))
 
     if len(srcnames) == 0:
         srcnames = datasrcs_info.srcinfos.keys()
 
     if relurls:
         for relurl in relurls:
-            handle_relurl(gazette_ia, relurl, to_upload, to_update, stats)
+            queue_relurl(retries, gazette_ia, relurl, to_upload, to_update, stats)
     elif from_stdin:
-        for line in sys.stdin:
-            relurl = line.strip()
-            handle_relurl(gazette_ia, relurl, to_upload, to_update, stats)
+        relurls = (line.strip() for line in sys.stdin)
+        queue_relurls(retries, gazette_ia, relurls, to_upload, to_update, stats)
+    elif consumer:
+        journal = storage.journal
+        offset  = journal.get_offset(consumer)
+        # offset of the first record of each relurl, the commit stops short
+        # of the relurls that were given up on
+        queued  = {}
+        failed  = []
+
+        def giveup(gazette_ia, relurl, to_upload, to_update, stats):
+            record_failure(gazette_ia, relurl, to_upload, to_update, stats)
+            failed.append(queued[relurl])
+
+        for nextoffset, record in journal.read(offset):
+            relurl = record['relurl']
+            # the raw file of a new document is journaled before its
+            # metadata, it is queued on the meta record that follows
+            ready  = record.get('kind') == 'meta' or \
+                     storage.get_metafile_path(relurl) != None
+            if ready and relurl not in queued and \
+                    gazette_ia.get_srcname(relurl) in srcnames:
+                queued[relurl] = offset
+                queue_relurl(retries, gazette_ia, relurl, to_upload, \
+                             to_update, stats, giveup = giveup)
+            offset = nextoffset
     else:        
-        for relurl in storage.find_matching_relurls(srcnames, start_ts, end_ts):
-            handle_relurl(gazette_ia, relurl, to_upload, to_update, stats)
-
-
+        relurls = storage.find_matching_relurls(srcnames, start_ts, end_ts)
+        queue_relurls(retries, gazette_ia, relurls, to_upload, to_update, stats)
+
+    retries.drain()
+
+    if consumer:
+        if failed:
+            offset = min(failed)
+            logging.getLogger('iasync').warning('Committing %s only up to %d, %d relurls failed', \
+                                                consumer, offset, len(failed))
+        journal.commit(consumer, offset)
+        journal.purge()
 
     if to_addrs:
         msg = stats.get_message(srcnames)
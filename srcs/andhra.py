@@ -175,6 +175,7 @@ class AndhraArchive(CentralBase):
         self.hostname     = 'gazettearchive.ap.gov.in'
         self.search_endp  = 'gt_PublicReport.aspx'
         self.result_table = 'FileMoveList2'
+        self.todate_field = 'txttodate'
 
     def get_search_results(self, search_url, dateobj, cookiejar):
         response = self.download_url(search_url, savecookies = cookiejar, loadcookies=cookiejar)
@@ -2,12 +2,25 @@ import logging
 import datetime
 import urllib.request, urllib.parse, urllib.error
 import os
+import re
 import time
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
 import requests
-from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
+from requests.cookies import extract_cookies_to_jar
 
 from ..utils import utils
+from ..utils import http_pool
+from ..utils.throttle import Outcome, Cancelled
+from ..utils.breaker import get_breaker, CircuitOpen
+from ..utils.ledger import RetryLedger
+from ..utils.retry_queue import RetryQueue, RetryLater, get_backoff
+from ..utils import latency
+from ..utils import page_cache
+from ..utils import cassette
+from ..utils.latency import LISTING, DOCUMENT
 
 from .datasrcs_info import get_start_date
 
@@ -17,6 +30,7 @@ class WebResponse:
        self.webpage      = None
        self.error        = None
        self.response_url = None
+       self.stream       = None
 
    def set_error(self, error):
        self.error = error
@@ -30,6 +44,27 @@ class WebResponse:
    def set_response_url(self, response_url):
        self.response_url = response_url
 
+   def set_stream(self, stream):
+       self.stream = stream
+
+class CancellableRetry(Retry):
+    # urllib3 sleeps out the backoff between its retries, a crawl that is
+    # asked to stop waits on its event instead
+    waiter = None
+
+    def new(self, **kw):
+        retry = Retry.new(self, **kw)
+        retry.waiter = self.waiter
+        return retry
+
+    def _sleep_backoff(self):
+        if self.waiter == None:
+            return Retry._sleep_backoff(self)
+
+        backoff = self.get_backoff_time()
+        if backoff > 0 and self.waiter(backoff):
+            raise Cancelled('retry backoff')
+
 class Downloader:
     def __init__(self, name, storage_manager):
         self.hostname    = None
@@ -42,42 +77,502 @@ class Downloader:
         self.retry_delay_base_secs = 100
         self.retry_delay_max_secs = 300
         self.request_timeout_secs = 400
+        # timeouts follow the observed latencies of the host once there are
+        # enough samples, request_timeout_secs stays the upper bound
+        self.adaptive_timeouts = True
+        self.timeout_factor    = 4
+        self.min_timeout_secs  = 30
+        # race a second GET for listing pages slower than this percentile
+        self.hedge_listings    = False
+        self.hedge_percentile  = 95
+        self.hedge_executor    = None
+        self.hedge_lock        = threading.Lock()
+        # the next listing page is fetched while the gazettes of the
+        # current one download
+        self.prefetch_executor = None
+        self.prefetch_lock     = threading.Lock()
+        # gazettes are streamed to disk in chunks of this size
+        self.chunk_size        = 64 * 1024
+        # the urllib based fetches never verified certificates (see haryana.py)
+        self.verify_certs = False
+        # caps the in-flight requests per hostname when set
+        self.host_slots   = None
+        # days can be fetched in any order and in parallel
+        self.independent_days = False
+        self.day_workers      = 1
+        # gazettes of a day fetched together by save_gazettes, the host
+        # slots still cap the requests in flight
+        self.gazette_workers  = 4
+        # consecutive failures after which requests to the host fail fast
+        self.breaker_failures   = 5
+        self.breaker_reset_secs = 300
+        # skipped days retried by a daily run, at most max_replay_days of
+        # them per run
+        self.max_replay_days    = 10
+        self.ledger    = None
+        self.day_state = threading.local()
+        self.retry_queue = None
+        self.retry_lock  = threading.Lock()
+        # set when the crawl is asked to stop, waits return early on it
+        self.event        = None
+        self.pending_days = set()
+        # reentrant as the SIGTERM checkpoint may interrupt a holder
+        self.pending_lock = threading.RLock()
+        # days with gazettes in the retry queue stay pending until the last
+        # of them is saved or given up on
+        self.parked_days   = {}
+        self.finished_days = set()
+        self.failed_days   = set()
 
-    
         self.logger      = logging.getLogger('crawler.%s' % self.name)
 
         self.useragent   = 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:59.0) Gecko/20100101 Firefox/59.0'
 
-    def all_downloads(self, event):
+    # crawlers are pickled into their processes unless the processes are
+    # forked, locks, thread locals and pools are made afresh in the child
+    process_attrs = ['hedge_lock', 'prefetch_lock', 'retry_lock', \
+                     'pending_lock', 'day_state', 'hedge_executor', \
+                     'prefetch_executor', 'retry_queue', 'ledger', 'event', \
+                     'host_slots']
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.process_attrs:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.hedge_lock        = threading.Lock()
+        self.prefetch_lock     = threading.Lock()
+        self.retry_lock        = threading.Lock()
+        self.pending_lock      = threading.RLock()
+        self.day_state         = threading.local()
+        self.hedge_executor    = None
+        self.prefetch_executor = None
+        self.retry_queue       = None
+        self.ledger            = None
+        self.event             = None
+        self.host_slots        = None
+
+    def get_all_range(self):
         start_date = get_start_date(self.name)
         assert start_date != None
-        return self.sync(start_date, datetime.datetime.today(), event)
+        return start_date, datetime.datetime.today()
 
-    def sync_daily(self, event):
+    def all_downloads(self, event):
+        fromdate, todate = self.get_all_range()
+        return self.sync(fromdate, todate, event)
+
+    def get_daily_range(self):
         todate = datetime.datetime.today() #- datetime.timedelta(days = 1)
         fromdate = todate - datetime.timedelta(days = self.lookback)
-        return self.sync(fromdate, todate, event)
+        return fromdate, todate
+
+    def sync_daily(self, event):
+        fromdate, todate = self.get_daily_range()
+        newdownloads = self.sync(fromdate, todate, event)
+        newdownloads.extend(self.replay_ledger(fromdate.date(), event))
+        return newdownloads
+
+    def get_ledger(self):
+        if self.ledger == None:
+            filepath = self.storage_manager.get_ledger_path(self.name)
+            self.ledger = RetryLedger(filepath)
+        return self.ledger
+
+    def replay_ledger(self, before, event):
+        ledger = self.get_ledger()
+        # days in the current window have been retried by sync already
+        dates  = [d for d in ledger.get_dates() if d < before]
+        if len(dates) > self.max_replay_days:
+            self.logger.info('Retrying %d of %d skipped days', \
+                             self.max_replay_days, len(dates))
 
-    def sync(self, fromdate, todate, event):
         newdownloads = []
+        for dateobj in dates[-self.max_replay_days:]:
+            if event.is_set():
+                break
+
+            self.logger.info('Retrying skipped day %s', dateobj)
+            ledger.add_attempt(dateobj)
+            newdownloads.extend(self.download_day(dateobj))
+        return newdownloads
+
+    def get_retry_queue(self):
+        with self.retry_lock:
+            if self.retry_queue == None:
+                self.retry_queue = RetryQueue(self.retry_delay_base_secs, \
+                                              self.retry_delay_max_secs, \
+                                              self.num_http_retries)
+            return self.retry_queue
+
+    def drain_retries(self, event):
+        queue   = self.get_retry_queue()
+        relurls = queue.drain(event)
+        if len(queue) > 0:
+            # the days of the gazettes left behind are tried again next time
+            self.checkpoint()
+        return [relurl for relurl in relurls if relurl != None]
+
+    def set_event(self, event):
+        self.event = event
+
+    def redirect(self, url):
+        # points the crawler at another server such as tools/mockportal.py,
+        # the urls on the portal host are rewritten to it
+        parsed = urllib.parse.urlparse(url)
+        origin = '%s://%s' % (parsed.scheme, parsed.netloc)
+        reobj  = re.compile('^https?://%s(?=[/?#]|$)' % re.escape(self.hostname), \
+                            re.IGNORECASE)
+        for name, value in list(vars(self).items()):
+            if isinstance(value, str):
+                setattr(self, name, reobj.sub(origin, value))
+        self.hostname = parsed.netloc
+
+    def is_cancelled(self):
+        return self.event != None and self.event.is_set()
+
+    def wait(self, secs):
+        # returns True if the crawl was cancelled during the wait
+        if self.event == None:
+            time.sleep(secs)
+            return False
+        return self.event.wait(secs)
+
+    def add_pending(self, dates):
+        # days being downloaded, those a stop cuts short are recorded in the
+        # ledger by checkpoint(). Days not reached yet are left out as a
+        # stopped backfill would otherwise fill the ledger.
+        with self.pending_lock:
+            self.pending_days.update(dates)
+
+    def checkpoint(self):
+        with self.pending_lock:
+            dates = sorted(self.pending_days)
+            self.pending_days = set()
+
+        if dates:
+            self.logger.warning('Recording %d pending days for a retry', len(dates))
+        ledger = self.get_ledger()
+        for dateobj in dates:
+            ledger.add(dateobj)
+
+    def download_day(self, dateobj):
+        self.logger.info('Date %s' % dateobj)
+        # parked fetches whose backoff has expired go before the next day
+        self.get_retry_queue().run_ready()
+        self.add_pending([dateobj])
+
+        self.day_state.skipped = False
+        self.day_state.dates   = [dateobj]
+        tmprel    = os.path.join (self.name, dateobj.__str__())
+        dls = self.download_oneday(tmprel, dateobj)
+        self.logger.info('Got %d gazettes for day %s' % (len(dls), dateobj))
+
+        if self.day_state.skipped:
+            self.logger.warning('Day %s is incomplete, recording it for a retry', \
+                                dateobj)
+        self.finish_days([dateobj])
+        return dls
+
+    def finish_days(self, dates):
+        ledger = self.get_ledger()
+        if self.day_state.skipped:
+            for dateobj in dates:
+                ledger.add(dateobj)
+
+        done = []
+        with self.pending_lock:
+            for dateobj in dates:
+                if self.day_state.skipped:
+                    self.failed_days.add(dateobj)
+                if dateobj in self.parked_days:
+                    self.finished_days.add(dateobj)
+                else:
+                    done.append(dateobj)
+            self.close_days(done)
+
+    def park_days(self, dates):
+        with self.pending_lock:
+            for dateobj in dates:
+                self.parked_days[dateobj] = self.parked_days.get(dateobj, 0) + 1
+
+    def unpark_days(self, dates, ok):
+        ledger = self.get_ledger()
+        if not ok:
+            for dateobj in dates:
+                ledger.add(dateobj)
+
+        done = []
+        with self.pending_lock:
+            for dateobj in dates:
+                if not ok:
+                    self.failed_days.add(dateobj)
+                self.parked_days[dateobj] -= 1
+                if self.parked_days[dateobj] > 0:
+                    continue
+                del self.parked_days[dateobj]
+                if dateobj in self.finished_days:
+                    self.finished_days.discard(dateobj)
+                    done.append(dateobj)
+            self.close_days(done)
+
+    def close_days(self, dates):
+        # called with the pending_lock held, a day leaves the ledger only
+        # if neither its listing nor any of its gazettes failed
+        ledger = self.get_ledger()
+        for dateobj in dates:
+            if dateobj in self.failed_days:
+                self.failed_days.discard(dateobj)
+            else:
+                ledger.remove(dateobj)
+            self.pending_days.discard(dateobj)
+
+    def get_dates(self, fromdate, todate):
+        dates = []
         while fromdate <= todate:
+            dates.append(fromdate.date())
+            fromdate += datetime.timedelta(days=1)
+        return dates
+
+    def sync(self, fromdate, todate, event):
+        if self.independent_days and self.day_workers > 1:
+            return self.sync_parallel(fromdate, todate, event)
+
+        dates = self.get_dates(fromdate, todate)
+
+        newdownloads = []
+        for dateobj in dates:
             if event.is_set():
                 self.logger.warning('Exiting prematurely as timer event is set')
+                self.checkpoint()
                 break
 
-            dateobj   = fromdate.date()
-            self.logger.info('Date %s' % dateobj)
-
-            tmprel    = os.path.join (self.name, dateobj.__str__())
-            dls = self.download_oneday(tmprel, dateobj)
-            self.logger.info('Got %d gazettes for day %s' % (len(dls), dateobj))
+            dls = self.download_day(dateobj)
             newdownloads.extend(dls)
-            fromdate += datetime.timedelta(days=1)
         return newdownloads
 
+    def sync_parallel(self, fromdate, todate, event):
+        dates = self.get_dates(fromdate, todate)
+
+        def download(dateobj):
+            if event.is_set():
+                return []
+            return self.download_day(dateobj)
+
+        newdownloads = []
+        with ThreadPoolExecutor(max_workers = self.day_workers) as executor:
+            for dls in executor.map(download, dates):
+                newdownloads.extend(dls)
+
+        if event.is_set():
+            self.logger.warning('Exiting prematurely as timer event is set')
+            self.checkpoint()
+        return newdownloads
+
+    def set_day_workers(self, day_workers):
+        self.day_workers = day_workers
+
+    def set_host_slots(self, host_slots):
+        self.host_slots = host_slots
+
+    def request_slot(self):
+        if self.host_slots == None:
+            return contextlib.nullcontext(Outcome())
+        return self.host_slots.slot(self.hostname, self.event)
+
+    def get_breaker(self):
+        return get_breaker(self.hostname, self.breaker_failures, \
+                           self.breaker_reset_secs)
+
+    def check_breaker(self, url):
+        if self.get_breaker().allow():
+            return None
+
+        self.day_state.skipped = True
+        self.logger.debug('Skipping %s as the circuit is open', url)
+        return CircuitOpen(self.hostname)
+
+    def check_cancelled(self, url):
+        if not self.is_cancelled():
+            return None
+
+        self.day_state.skipped = True
+        self.logger.debug('Skipping %s as the crawl is cancelled', url)
+        return Cancelled(url)
+
+    def is_retryable(self, error):
+        if isinstance(error, CircuitOpen) or isinstance(error, Cancelled):
+            return False
+        if isinstance(error, requests.HTTPError):
+            return http_pool.get_status_code(error) in [503, 504, 403]
+        return True
+
+    def update_breaker(self, error):
+        breaker = self.get_breaker()
+        if error == None:
+            breaker.record_success()
+        elif isinstance(error, requests.HTTPError):
+            if http_pool.get_status_code(error) in [503, 504, 403]:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        elif isinstance(error, requests.RequestException):
+            breaker.record_failure()
+        elif breaker.is_half_open():
+            # a probe that ends in any other error must not leave the
+            # breaker half open, as it lets no request through then
+            breaker.record_failure()
+
+        if breaker.is_open():
+            # the day that tripped the breaker is incomplete as well
+            self.day_state.skipped = True
+
+    def set_outcome(self, outcome, response):
+        outcome.status  = response.status_code
+        outcome.latency = response.elapsed.total_seconds()
+
+    def get_timeout(self, reqclass):
+        if not self.adaptive_timeouts:
+            return self.request_timeout_secs
+
+        p99 = latency.percentile(self.hostname, reqclass, 99)
+        if p99 == None:
+            return self.request_timeout_secs
+
+        timeout = max(self.min_timeout_secs, self.timeout_factor * p99)
+        return min(self.request_timeout_secs, timeout)
+
+    def get_hedge_executor(self):
+        with self.hedge_lock:
+            if self.hedge_executor == None:
+                self.hedge_executor = ThreadPoolExecutor(max_workers = 4)
+            return self.hedge_executor
+
+    def send_request(self, session, prepped, settings, reqclass, stream):
+        timeout = self.get_timeout(reqclass)
+
+        if self.hedge_listings and reqclass == LISTING and not stream and \
+                prepped.method == 'GET':
+            hedge_after = latency.percentile(self.hostname, reqclass, \
+                                             self.hedge_percentile)
+            if hedge_after != None:
+                return self.send_hedged(session, prepped, settings, timeout, \
+                                        hedge_after)
+
+        return self.send_once(session, prepped, settings, timeout, reqclass, \
+                              stream)
+
+    def send_once(self, session, prepped, settings, timeout, reqclass, \
+                  stream = False):
+        start = time.time()
+        try:
+            with contextlib.ExitStack() as stack:
+                outcome  = stack.enter_context(self.request_slot())
+                response = session.send(prepped, timeout = timeout, **settings)
+                self.set_outcome(outcome, response)
+                if stream:
+                    # the body is yet to come, the slot is held until the
+                    # stream is released
+                    response.slot = (stack.pop_all(), outcome, start, reqclass)
+                    return response
+        except requests.Timeout:
+            # a timed out request took at least that long
+            latency.record(self.hostname, reqclass, timeout)
+            raise
+
+        latency.record(self.hostname, reqclass, \
+                       response.elapsed.total_seconds())
+        return response
+
+    def release_stream(self, stream, error = None):
+        stream.close()
+
+        slot = getattr(stream, 'slot', None)
+        if slot == None:
+            return
+        stream.slot = None
+
+        stack, outcome, start, reqclass = slot
+        # the whole transfer, not just the wait for the headers
+        outcome.latency = time.time() - start
+        latency.record(self.hostname, reqclass, outcome.latency)
+        if error != None:
+            stack.__exit__(type(error), error, error.__traceback__)
+        else:
+            stack.close()
+
+    def send_hedged(self, session, prepped, settings, timeout, hedge_after):
+        executor = self.get_hedge_executor()
+        first = executor.submit(self.send_once, session, prepped, settings, \
+                                timeout, LISTING)
+        done, not_done = wait([first], timeout = hedge_after)
+        if done:
+            return first.result()
+
+        self.logger.info('Hedging %s after %.1f secs', prepped.url, hedge_after)
+        second = executor.submit(self.send_once, session, prepped.copy(), \
+                                 settings, timeout, LISTING)
+
+        # the slower of the two is left to finish on its own, its response
+        # is closed once it comes in
+        for future in as_completed([first, second]):
+            if future.exception() == None:
+                loser = second if future is first else first
+                if not loser.cancel():
+                    loser.add_done_callback(self.close_hedge)
+                return future.result()
+        return first.result()
+
+    def close_hedge(self, future):
+        if future.exception() == None:
+            future.result().close()
+
+    def get_prefetch_executor(self):
+        with self.prefetch_lock:
+            if self.prefetch_executor == None:
+                self.prefetch_executor = \
+                        ThreadPoolExecutor(max_workers = max(1, self.day_workers))
+            return self.prefetch_executor
+
+    def fetch_page(self, fetch):
+        # the pool thread has a day_state of its own
+        self.day_state.skipped = False
+        page = fetch()
+        return page, self.day_state.skipped
+
+    def prefetch_pages(self, fetch, parse_page):
+        # parse_page(page, pagenum) returns the items on a page and a
+        # callable that fetches the next page, or None on the last page.
+        # The next page is on its way while the caller works on the items.
+        pagenum = 1
+        page = fetch()
+        while page != None:
+            items, fetch_next = parse_page(page, pagenum)
+
+            future = None
+            if fetch_next != None and not self.is_cancelled():
+                future = self.get_prefetch_executor().submit(self.fetch_page, \
+                                                             fetch_next)
+            try:
+                yield items
+            except GeneratorExit:
+                if future != None:
+                    future.cancel()
+                raise
+
+            if future == None:
+                break
+
+            page, skipped = future.result()
+            if skipped:
+                self.day_state.skipped = True
+            pagenum += 1
+
     def get_session_retry(self):
         retries = self.num_http_retries
-        retry = Retry(
+        retry = CancellableRetry(
             total=retries,
             read=retries,
             connect=retries,
@@ -85,45 +580,74 @@ class Downloader:
             backoff_factor=self.retry_delay_base_secs,
             status_forcelist=set([503,504,403]),
         )
+        retry.waiter = self.wait
         return retry
 
     def get_session(self):
         s = requests.session()
         retry = self.get_session_retry()
-        s.mount('http://', HTTPAdapter(max_retries=retry))
-        s.mount('https://', HTTPAdapter(max_retries=retry))
+        s.mount('http://', cassette.get_adapter(max_retries=retry))
+        s.mount('https://', cassette.get_adapter(max_retries=retry))
         return s
 
+    def get_pooled_session(self, retry = False):
+        if retry:
+            return http_pool.get_session(self.hostname, 'retry', \
+                                         self.get_session_retry())
+        return http_pool.get_session(self.hostname)
+
+    def save_response_cookies(self, cookiejar, response):
+        for r in response.history + [response]:
+            if 'Set-Cookie' in r.headers:
+                extract_cookies_to_jar(cookiejar, r.request, r.raw)
 
     def download_url_using_session(self, url, session = None, postdata = None, \
-                                   referer = None, headers = {}):
+                                   referer = None, headers = {}, cookiejar = None):
         if session == None:
-            session = self.get_session()
+            session = self.get_pooled_session(retry = True)
 
         webresponse = WebResponse()
 
+        headers = dict(headers)
         headers['User-agent'] = self.useragent
 
         if referer:
             headers['Referer'] = referer
 
+        error = self.check_cancelled(url) or self.check_breaker(url)
+        if error != None:
+            webresponse.set_error(error)
+            return webresponse
+
         fixed_url = self.url_fix(url)        
-        req_kwargs = { 'timeout': self.request_timeout_secs }
+        req_kwargs = { 'timeout': self.get_timeout(LISTING) }
+        if cookiejar != None:
+            req_kwargs['cookies'] = cookiejar
 
         try:
-            if postdata == None:
-                response = session.get(fixed_url, headers=headers, **req_kwargs)
-            else:
-                if type(postdata) == list:
-                    postdata = dict(postdata)
-                response = session.post(fixed_url, data=postdata, headers=headers, **req_kwargs)
+            with self.request_slot() as outcome:
+                if postdata == None:
+                    response = session.get(fixed_url, headers=headers, **req_kwargs)
+                else:
+                    if type(postdata) == list:
+                        postdata = dict(postdata)
+                    response = session.post(fixed_url, data=postdata, headers=headers, **req_kwargs)
+                self.set_outcome(outcome, response)
+            latency.record(self.hostname, LISTING, outcome.latency)
             self.logger.debug('Request url: %s headers: %s data: %s', \
                               fixed_url, response.request.headers, postdata)
+            if cookiejar != None:
+                self.save_response_cookies(cookiejar, response)
             status_code = response.raise_for_status()
             webresponse.set_webpage(response.content)
             webresponse.set_srvresponse({ 'headers': response.headers, 'status': response.status_code })
             webresponse.set_response_url(response.url)
+            self.update_breaker(None)
         except Exception as e:
+            if isinstance(e, Cancelled):
+                # stopped while waiting for a slot or a retry backoff
+                self.day_state.skipped = True
+            self.update_breaker(e)
             webresponse.set_error(e)
             self.logger.warning('Could not fetch: %s error: %s' % (url, e))
             return webresponse
@@ -133,17 +657,19 @@ class Downloader:
 
     def download_url(self, url, loadcookies = None, savecookies = None, \
                      postdata = None, referer = None, \
-                     encodepost= True, headers = {}):
+                     encodepost= True, headers = {}, reqclass = LISTING):
         for i in range(0, self.num_http_retries):
-            if i > 0:
-                time.sleep(i * self.retry_delay_base_secs)
+            if i > 0 and self.wait(get_backoff(i, self.retry_delay_base_secs, \
+                                               self.retry_delay_max_secs)):
+                break
             response = self.download_url_onetime(url, loadcookies, savecookies,\
                                                  postdata, referer, \
-                                                 encodepost, headers)
+                                                 encodepost, headers, reqclass)
             if response.error == None:
                 return response
-            elif isinstance(response.error, urllib.error.HTTPError) and \
-                    response.error.code not in [503, 504, 403]:
+            elif not self.is_retryable(response.error) or \
+                    self.get_breaker().is_open():
+                # no point in waiting on a host that is down
                 break
 
             i += 1
@@ -151,13 +677,21 @@ class Downloader:
         return None
 
     def download_url_onetime(self, url, loadcookies, savecookies, \
-                             postdata, referer, encodepost, headers):
+                             postdata, referer, encodepost, headers, \
+                             reqclass = LISTING, stream = False):
 
         webresponse = WebResponse()
 
-        if self.backoff > 0:
-            time.sleep(self.backoff)
+        error = self.check_cancelled(url) or self.check_breaker(url)
+        if error != None:
+            webresponse.set_error(error)
+            return webresponse
+
+        if self.backoff > 0 and self.wait(self.backoff):
+            webresponse.set_error(Cancelled(url))
+            return webresponse
 
+        headers = dict(headers)
         headers['User-agent'] = self.useragent
 
         if referer:
@@ -167,39 +701,54 @@ class Downloader:
         if postdata:
             if encodepost:
                 encodedData = urllib.parse.urlencode(postdata).encode('utf-8')
+                if 'Content-Type' not in headers:
+                    headers['Content-Type'] = 'application/x-www-form-urlencoded'
             else:
                 encodedData = postdata
 
         fixed_url = self.url_fix(url)        
-        request = urllib.request.Request(fixed_url, encodedData, headers)
+        method    = 'GET' if encodedData == None else 'POST'
+        request   = requests.Request(method, fixed_url, data = encodedData, \
+                                     headers = headers, cookies = loadcookies)
 
-        if loadcookies != None:
-            loadcookies.add_cookie_header(request)
-            if 'Cookie' in request.unredirected_hdrs:
-                request.headers['Cookie'] = request.unredirected_hdrs.pop('Cookie')
+        session  = self.get_pooled_session()
+        prepped  = session.prepare_request(request)
+        response = None
         self.logger.debug('Request url: %s headers: %s data: %s', \
-                            request.full_url, request.headers, request.data)
+                            prepped.url, prepped.headers, prepped.body)
         try:
-            opener  = urllib.request.urlopen(request, timeout = self.request_timeout_secs)
-            response = opener.info()
-            webpage  = opener.read()
+            settings = session.merge_environment_settings(prepped.url, {}, \
+                                                     stream, self.verify_certs, None)
+            response = self.send_request(session, prepped, settings, \
+                                         reqclass, stream)
+            if savecookies != None:
+                self.save_response_cookies(savecookies, response)
+
+            if stream and not response.ok:
+                self.release_stream(response)
+            response.raise_for_status()
             
-            webresponse.set_webpage(webpage)
-            webresponse.set_srvresponse(response)
-            webresponse.set_response_url(opener.geturl())
+            if stream:
+                # the caller reads the body and closes the response
+                webresponse.set_stream(response)
+            else:
+                webresponse.set_webpage(response.content)
+            webresponse.set_srvresponse(response.headers)
+            webresponse.set_response_url(response.url)
+            self.update_breaker(None)
 
-            self.logger.info('Url: %s response_url: %s Status: %s' % (fixed_url, opener.geturl(), opener.getcode()))
+            self.logger.info('Url: %s response_url: %s Status: %s' % (fixed_url, response.url, response.status_code))
         except Exception as e:
+            if stream and response != None:
+                self.release_stream(response)
+            if isinstance(e, Cancelled):
+                self.day_state.skipped = True
+            self.update_breaker(e)
             webresponse.set_error(e)
             self.logger.warning('Could not fetch: %s error: %s' % (url, e))
             return webresponse 
 
-        self.logger.debug('Server response: %s', response)
-
-        if 'Set-Cookie' in response: 
-            cookie = response['Set-Cookie']
-            if savecookies != None and cookie:
-                savecookies.extract_cookies(opener, request)
+        self.logger.debug('Server response: %s', response.headers)
 
         return webresponse
 
@@ -231,35 +780,241 @@ class BaseGazette(Downloader):
     def is_valid_gazette(self, doc, min_size):
         return (min_size <= 0 or len(doc) > min_size)
 
+    def download_listing(self, url):
+        # listing pages are shared by all the days in a run, only plain
+        # GETs without cookies are cached
+        def loader():
+            response = self.download_url(url)
+            if response == None or response.webpage == None:
+                return None, 0
+            return response, len(response.webpage)
+
+        return page_cache.get((url, 'raw'), loader)
+
+    def get_listing_page(self, url):
+        # the parsed tree is shared, callers must not modify it
+        def loader():
+            response = self.download_listing(url)
+            if response == None:
+                return None, 0
+            d = utils.parse_webpage(response.webpage, self.parser)
+            return d, len(response.webpage) * page_cache.PARSED_FACTOR
+
+        return page_cache.get((url, self.parser), loader)
+
     def get_file_extension(self, doc):
         mtype = utils.get_buffer_type(doc)
         return utils.get_file_extension(mtype)
 
+    def fetch_gazette(self, gurl, postdata, referer, cookiefile, hdrs, \
+                      encodepost, range_hdrs):
+        if cookiefile:
+            headers = dict(hdrs)
+            headers.update(range_hdrs)
+            return self.download_url_onetime(gurl, cookiefile, None, postdata, \
+                                             referer, encodepost, headers, \
+                                             DOCUMENT, stream = True)
+        return self.download_url_onetime(gurl, None, None, postdata, \
+                                         referer, encodepost, range_hdrs, \
+                                         DOCUMENT, stream = True)
+
+    def get_partial(self, relurl, gurl, postdata):
+        if postdata:
+            return 0, None, {}
+
+        offset, partinfo = self.storage_manager.get_partial(relurl)
+        if offset == 0 or partinfo == None or partinfo.get('url') != gurl:
+            return 0, None, {}
+
+        validator = partinfo.get('etag') or partinfo.get('last_modified')
+        if not validator:
+            return 0, None, {}
+
+        # If-Range makes the server send the whole doc if it has changed
+        range_hdrs = {'Range': 'bytes=%d-' % offset, 'If-Range': validator}
+        return offset, partinfo, range_hdrs
+
+    def get_partinfo(self, gurl, postdata, stream):
+        headers = stream.headers
+        if postdata or headers.get('Content-Encoding', 'identity') != 'identity':
+            return None
+
+        if stream.status_code != 206 and \
+                headers.get('Accept-Ranges', '').lower() != 'bytes':
+            return None
+
+        etag = headers.get('ETag')
+        if etag and etag.startswith('W/'):
+            # weak validators are not allowed in If-Range
+            etag = None
+
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return None
+
+        return {'url': gurl, 'etag': etag, 'last_modified': last_modified}
+
+    def is_resumed(self, stream, offset):
+        content_range = stream.headers.get('Content-Range', '')
+        return stream.status_code == 206 and \
+               content_range.startswith('bytes %d-' % offset)
+
+    def is_valid_stream(self, head, size, min_size):
+        return (min_size <= 0 or size > min_size)
+
+    def save_stream(self, relurl, gurl, postdata, response, offset, \
+                    oldinfo, min_size):
+        def is_valid(head, size):
+            return self.is_valid_stream(head, size, min_size)
+
+        stream   = response.stream
+        partinfo = self.get_partinfo(gurl, postdata, stream)
+
+        append = False
+        if offset > 0 and self.is_resumed(stream, offset):
+            self.logger.info('Resuming %s from byte %d', relurl, offset)
+            append = True
+            if partinfo == None:
+                partinfo = oldinfo
+        elif offset > 0:
+            self.logger.info('Restarting %s as it changed on the server', relurl)
+
+        if not append:
+            # a partial this response does not continue would otherwise be
+            # resumed by a later attempt, even with no partinfo for this one
+            self.storage_manager.discard_partial(relurl)
+
+        def read_chunks():
+            for chunk in stream.iter_content(chunk_size = self.chunk_size):
+                if self.is_cancelled():
+                    raise Cancelled(relurl)
+                yield chunk
+
+        error = None
+        try:
+            return self.storage_manager.save_rawdoc_stream(self.name, relurl, \
+                                                           read_chunks(), is_valid, \
+                                                           partinfo, append)
+        except Cancelled:
+            self.day_state.skipped = True
+            return None
+        except requests.RequestException as e:
+            error = e
+            self.logger.warning('Transfer of %s broke off: %s', relurl, e)
+            self.update_breaker(e)
+            raise RetryLater(e)
+        finally:
+            # frees the host slot held since the headers came in
+            self.release_stream(stream, error)
+
     def save_gazette(self, relurl, gurl, metainfo, postdata = None, \
                      referer = None, cookiefile = None, validurl = True, \
                      min_size=0, count=0, hdrs = {}, encodepost = True):
+        args = (relurl, gurl, metainfo, postdata, referer, cookiefile, \
+                validurl, min_size, hdrs, encodepost)
+        try:
+            return self.save_gazette_onetime(*args)
+        except RetryLater:
+            if postdata != None or cookiefile != None:
+                # form posts carry the viewstate, cookies or captcha of the
+                # listing they came from and go stale in the queue, the day
+                # is listed afresh when the ledger replays it
+                self.logger.warning('Could not get %s, recording its day for a retry', \
+                                    relurl)
+                self.day_state.skipped = True
+                return False
+
+            # retried from the queue while the crawl goes on with other days,
+            # the day is recorded in the ledger if the queue gives up on it
+            dates = getattr(self.day_state, 'dates', None) or []
+            self.park_days(dates)
+            self.get_retry_queue().park(self.retry_gazette, (dates, args), 1, \
+                                        self.giveup_gazette)
+            return False
+
+    def save_gazettes(self, items):
+        # items are (relurl, gurl, metainfo) of plain GET urls. Returns the
+        # relurls that were saved, in the order of the items.
+        if len(items) <= 1 or self.gazette_workers <= 1:
+            return [relurl for relurl, gurl, metainfo in items \
+                    if self.save_gazette(relurl, gurl, metainfo)]
+
+        # items with the same relurl are saved one after the other by the
+        # same task so that they do not write to the same files
+        groups = {}
+        for item in items:
+            if item[0] not in groups:
+                groups[item[0]] = []
+            groups[item[0]].append(item)
+
+        dates = getattr(self.day_state, 'dates', None)
+
+        def save(group):
+            self.day_state.skipped = False
+            self.day_state.dates   = dates
+            saved = False
+            for relurl, gurl, metainfo in group:
+                if self.save_gazette(relurl, gurl, metainfo):
+                    saved = True
+            return saved, self.day_state.skipped
+
+        workers = min(self.gazette_workers, len(groups))
+        with ThreadPoolExecutor(max_workers = workers) as executor:
+            results = list(executor.map(save, groups.values()))
+
+        relurls = []
+        for relurl, (saved, skipped) in zip(groups.keys(), results):
+            if skipped:
+                self.day_state.skipped = True
+            if saved:
+                relurls.append(relurl)
+        return relurls
+
+    def retry_gazette(self, dates, args):
+        # the retry may run in the middle of another day
+        skipped = getattr(self.day_state, 'skipped', False)
+        self.day_state.skipped = False
+        try:
+            saved  = self.save_gazette_onetime(*args)
+            failed = self.day_state.skipped
+        finally:
+            self.day_state.skipped = skipped
+
+        self.unpark_days(dates, not failed)
+        if saved:
+            return args[0]
+        return None
+
+    def giveup_gazette(self, dates, args):
+        self.logger.warning('Gave up on %s, recording its day for a retry', \
+                            args[0])
+        self.unpark_days(dates, False)
+
+    def save_gazette_onetime(self, relurl, gurl, metainfo, postdata, referer, \
+                             cookiefile, validurl, min_size, hdrs, encodepost):
         updated = False
         if self.storage_manager.should_download_raw(relurl, gurl, \
                                                     validurl = validurl):
-            if cookiefile:
-                response = self.download_url(gurl, referer = referer, \
-                                 postdata = postdata, loadcookies = cookiefile,\
-                                 headers = hdrs, encodepost = encodepost)
-            else:
-                response = self.download_url(gurl, postdata = postdata, \
-                                             encodepost = encodepost, \
-                                             referer = referer)
+            offset, oldinfo, range_hdrs = self.get_partial(relurl, gurl, postdata)
+            response = self.fetch_gazette(gurl, postdata, referer, cookiefile, \
+                                          hdrs, encodepost, range_hdrs)
 
-            if response == None:
+            if response.error != None:
+                if offset > 0 and \
+                        http_pool.get_status_code(response.error) == 416:
+                    # the partial file does not fit the doc anymore
+                    self.storage_manager.discard_partial(relurl)
+                    raise RetryLater(response.error)
+                if self.is_retryable(response.error):
+                    raise RetryLater(response.error)
                 return updated
                  
-            doc = response.webpage 
-            if doc and self.is_valid_gazette(doc, min_size):  
-                if self.storage_manager.save_rawdoc(self.name, relurl, response.srvresponse, doc):
-                    updated = True
-                    self.logger.info('Saved rawfile %s' % relurl)
-                else:
-                    self.logger.info('not able to save the doc %s' % relurl)
+            rawinfo = self.save_stream(relurl, gurl, postdata, response, \
+                                       offset, oldinfo, min_size)
+            if rawinfo:
+                updated = True
+                self.logger.info('Saved rawfile %s size: %d sha256: %s', \
+                                 relurl, rawinfo['size'], rawinfo['sha256'])
             else:                    
                 self.logger.info('doc not downloaded %s' % relurl)
         else:
@@ -234,6 +234,9 @@ class BIS(BaseGazette):
             return False
         return True
 
+    def is_valid_stream(self, head, size, min_size):
+        return self.is_valid_gazette(head, min_size)
+
     def parse_search_results(self, d, dateobj):
         minfos = []
 
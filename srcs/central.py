@@ -2,10 +2,19 @@ from http.cookiejar import CookieJar
 import urllib.request, urllib.parse, urllib.error
 import re
 import os
+import datetime
+import threading
 
 from ..utils import utils
+from ..utils import forms
 from .basegazette import BaseGazette
 
+class SearchSession:
+    def __init__(self, cookiejar, url, webpage):
+        self.cookiejar = cookiejar
+        self.url       = url
+        self.webpage   = webpage
+
 class CentralBase(BaseGazette):
     def __init__(self, name, storage):
         BaseGazette.__init__(self, name, storage)
@@ -17,6 +26,33 @@ class CentralBase(BaseGazette):
         self.result_table= 'tbl_Gazette'
         self.gazette_js  = 'window.open\(\'(?P<href>[^\']+)'
 
+        # search over windows of range_days and bucket the results by
+        # their issue date. Windows are halved when the portal returns
+        # max_range_results or more rows. Sources whose result table has
+        # no issue date go back to searching one day at a time, as does a
+        # window with a row whose date cannot be read. Only sources that
+        # name the end date field of their form do this.
+        self.range_days        = 7
+        self.todate_field      = None
+        self.max_range_results = 500
+        self.range_capable     = True
+        self.issuedate_regex   = 'Issue\s+Date|Gazette\s+Date|Publish(ed|ing)?\s+Date|Date\s+of\s+(Issue|Publication)'
+        # navigated search forms with their cookies, reused across days
+        self.search_sessions   = []
+        self.session_lock      = threading.Lock()
+        self.issuedate_formats = ['%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', \
+                                  '%d-%b-%Y', '%d %b %Y', '%d-%B-%Y', \
+                                  '%d %B %Y', '%Y-%m-%d']
+
+    def __getstate__(self):
+        state = BaseGazette.__getstate__(self)
+        state.pop('session_lock', None)
+        return state
+
+    def __setstate__(self, state):
+        BaseGazette.__setstate__(self, state)
+        self.session_lock = threading.Lock()
+
     def find_search_form(self, d, form_href):
         search_form = None
         forms = d.find_all('form')
@@ -75,12 +111,45 @@ class CentralBase(BaseGazette):
 
         return postdata
 
+    def navigate_search(self, dateobj):
+        return None
+
+    def get_search_session(self, dateobj):
+        with self.session_lock:
+            if self.search_sessions:
+                return self.search_sessions.pop()
+        return self.navigate_search(dateobj)
+
+    def put_search_session(self, session):
+        with self.session_lock:
+            self.search_sessions.append(session)
+
+    def submit_search(self, session, dateobj):
+        form_href = session.url.split('/')[-1]
+        postdata  = self.get_form_data(session.webpage, dateobj, form_href)
+        if postdata == None:
+            return None
+
+        postdata.extend(self.submit_fields)
+        response = self.download_url(session.url, savecookies = session.cookiejar, \
+                                     referer = session.url, \
+                                     loadcookies = session.cookiejar, \
+                                     postdata = postdata)
+        if response == None or response.webpage == None:
+            return None
+
+        # an expired session is sent back to the start of the site
+        if response.response_url.split('/')[-1] != form_href or \
+                self.get_search_form(response.webpage, dateobj, form_href) == None:
+            return None
+        return response
+
     def get_search_form(self, webpage, dateobj, form_href):
         if webpage == None:
             self.logger.warning('Unable to download the starting search page for day: %s', dateobj)
             return None 
 
-        d = utils.parse_webpage(webpage, self.parser)
+        d = forms.parse_page(webpage)
         if d == None:
             self.logger.warning('Unable to parse the search page for day: %s', dateobj)
             return None
@@ -98,8 +167,19 @@ class CentralBase(BaseGazette):
         inputs = search_form.find_all(reobj)
         postdata = self.get_post_data(inputs, dateobj)
 
+        todate = self.get_search_todate()
+        if todate != None:
+            # let the source format the end date the way its form wants it
+            todata = dict(self.get_post_data(inputs, todate))
+            if self.todate_field in todata:
+                postdata = self.replace_field(postdata, self.todate_field, \
+                                              todata[self.todate_field])
+
         return postdata
 
+    def get_search_todate(self):
+        return getattr(self.day_state, 'search_todate', None)
+
     def get_search_results(self, search_url, dateobj, cookiejar):
         referer_url = urllib.parse.urljoin(search_url, 'SearchMenu.aspx')
         response = self.download_url(search_url, savecookies = cookiejar, loadcookies=cookiejar, referer = referer_url)
@@ -145,21 +225,29 @@ class CentralBase(BaseGazette):
         metainfos = []
         nextpage  = None
 
-        d = utils.parse_webpage(webpage, self.parser)
-        if not d:
+        tables = self.get_result_tables(webpage)
+        if tables == None:
             self.logger.warning('Unable to parse search result page for %s', dateobj)
             return metainfos, nextpage
 
-        tables = d.find_all('table', {'id': self.result_table})
-
         if len(tables) != 1:
             self.logger.warning('Could not find the result table for %s', dateobj)
             return metainfos, nextpage
         
+        ranged  = self.get_search_todate() != None
+        datecol = None
+
         order = None
         for tr in tables[0].find_all('tr'):
             if not order:
                 order = self.get_column_order(tr)
+                if ranged:
+                    datecol = self.find_issuedate_column(tr)
+                    if datecol == None:
+                        self.logger.warning('No issue date in the results for %s, searching day by day', dateobj)
+                        self.range_capable = False
+                        self.day_state.range_failed = True
+                        return [], None
                 continue
 
             if nextpage == None:
@@ -170,10 +258,56 @@ class CentralBase(BaseGazette):
             if tr.find('input') == None and tr.find('a') == None:
                 continue
 
+            num = len(metainfos)
             self.process_result_row(tr, metainfos, dateobj, order)
+            # rows of a nested pager table carry no download and no date
+            if ranged and len(metainfos) > num and 'download' in metainfos[num]:
+                self.set_issuedate(tr, metainfos[num:], datecol)
 
         return metainfos, nextpage
 
+    def get_result_tables(self, webpage):
+        return utils.parse_tables(webpage, {'id': self.result_table}, \
+                                  self.parser)
+
+    def find_issuedate_column(self, tr):
+        i = 0
+        for th in tr.find_all('th'):
+            txt = utils.get_tag_contents(th)
+            if txt and re.search(self.issuedate_regex, txt, re.IGNORECASE):
+                return i
+            i += 1
+        return None
+
+    def parse_issuedate(self, txt):
+        txt = txt.strip()
+        for fmt in self.issuedate_formats:
+            try:
+                return datetime.datetime.strptime(txt, fmt).date()
+            except ValueError:
+                pass
+
+        dateobj = utils.parse_datestr(txt)
+        if dateobj != None:
+            return dateobj.date()
+        return None
+
+    def set_issuedate(self, tr, metainfos, datecol):
+        tds = tr.find_all('td')
+        dateobj = None
+        if len(tds) > datecol:
+            txt = utils.get_tag_contents(tds[datecol])
+            if txt:
+                dateobj = self.parse_issuedate(txt)
+
+        if dateobj == None:
+            self.logger.warning('Unable to get the issue date of %s', metainfos)
+            self.day_state.range_failed = True
+            return
+
+        for metainfo in metainfos:
+            metainfo.set_date(dateobj)
+
     def find_next_page(self, tr, curr_page):
         classes = tr.get('class')
         if classes and 'pager' in classes:
@@ -349,8 +483,10 @@ class CentralBase(BaseGazette):
 
             postdata = self.get_form_data(response.webpage, dateobj, self.search_endp)
 
-            relurls = self.download_metainfos(relpath, metainfos, search_url, \
-                                              postdata, cookiejar)
+            relurls = self.download_results(relpath, metainfos, search_url, \
+                                            postdata, cookiejar)
+            if relurls == None:
+                break
             dls.extend(relurls)
             if nextpage:
                 pagenum += 1
@@ -361,6 +497,107 @@ class CentralBase(BaseGazette):
  
         return dls
 
+    def download_results(self, relpath, metainfos, search_url, \
+                         postdata, cookiejar):
+        if self.get_search_todate() == None:
+            return self.download_metainfos(relpath, metainfos, search_url, \
+                                           postdata, cookiejar)
+
+        self.day_state.num_results += len(metainfos)
+        if getattr(self.day_state, 'range_failed', False) or \
+                self.day_state.num_results >= self.max_range_results:
+            return None
+
+        bydate = {}
+        for metainfo in metainfos:
+            if 'download' not in metainfo:
+                continue
+            dateobj = metainfo.get_date()
+            if dateobj not in bydate:
+                bydate[dateobj] = []
+            bydate[dateobj].append(metainfo)
+
+        dls = []
+        for dateobj in sorted(bydate.keys()):
+            daypath = os.path.join(self.name, dateobj.__str__())
+            relurls = self.download_metainfos(daypath, bydate[dateobj], \
+                                              search_url, postdata, cookiejar)
+            dls.extend(relurls)
+        return dls
+
+    def sync(self, fromdate, todate, event):
+        if self.range_days <= 1 or self.todate_field == None:
+            return BaseGazette.sync(self, fromdate, todate, event)
+
+        dates = self.get_dates(fromdate, todate)
+
+        newdownloads = []
+        for i in range(0, len(dates), self.range_days):
+            if event.is_set():
+                self.logger.warning('Exiting prematurely as timer event is set')
+                self.checkpoint()
+                break
+
+            dls = self.download_window(dates[i:i + self.range_days])
+            newdownloads.extend(dls)
+        return newdownloads
+
+    def download_days(self, dates):
+        dls = []
+        for dateobj in dates:
+            dls.extend(self.download_day(dateobj))
+        return dls
+
+    def download_window(self, dates):
+        if len(dates) == 1 or not self.range_capable:
+            return self.download_days(dates)
+
+        dls = self.download_range(dates)
+        if dls != None:
+            return dls
+
+        if self.day_state.range_failed:
+            # results that cannot be bucketed by date, only this window
+            # is searched day by day
+            return self.download_days(dates)
+
+        mid = len(dates) // 2
+        return self.download_window(dates[:mid]) + \
+               self.download_window(dates[mid:])
+
+    def download_range(self, dates):
+        fromdate, todate = dates[0], dates[-1]
+        self.logger.info('Dates %s to %s' % (fromdate, todate))
+        self.get_retry_queue().run_ready()
+        self.add_pending(dates)
+
+        self.day_state.skipped       = False
+        self.day_state.dates         = dates
+        self.day_state.search_todate = todate
+        self.day_state.num_results   = 0
+        self.day_state.range_failed  = False
+        try:
+            dls = self.download_oneday(self.name, fromdate)
+            if dls == None:
+                dls = []
+        finally:
+            self.day_state.search_todate = None
+
+        if self.day_state.range_failed:
+            return None
+
+        if self.day_state.num_results >= self.max_range_results:
+            self.logger.info('Got %d results for %s to %s, splitting the range', \
+                             self.day_state.num_results, fromdate, todate)
+            return None
+
+        self.logger.info('Got %d gazettes for %s to %s' % (len(dls), fromdate, todate))
+        if self.day_state.skipped:
+            self.logger.warning('Dates %s to %s are incomplete, recording them for a retry', \
+                                fromdate, todate)
+        self.finish_days(dates)
+        return dls
+
     def download_metainfos(self, relpath, metainfos, search_url, \
                            postdata, cookiejar):
         dls = []
@@ -378,7 +615,9 @@ class CentralBase(BaseGazette):
 class CentralWeekly(CentralBase):
     def __init__(self, name, storage):
         CentralBase.__init__(self, name, storage)
-
+        self.todate_field = 'txtDateTo'
+        self.submit_fields = [('ImgSubmitDetails.x', '63'), \
+                              ('ImgSubmitDetails.y', '22')]
 
     def modify_partnum(self, postdata, partnum):
         newdata = []
@@ -388,15 +627,14 @@ class CentralWeekly(CentralBase):
             newdata.append((k, v))
         return newdata
 
-    def download_oneday(self, relpath, dateobj):
-        dls = []
+    def navigate_search(self, dateobj):
         cookiejar  = CookieJar()
         postdata = None
         while postdata == None:
             response = self.download_url(self.baseurl, savecookies = cookiejar, loadcookies = cookiejar)
             if not response:
                 self.logger.warning('Could not fetch %s for the day %s', self.baseurl, dateobj)
-                return dls
+                return None
 
             curr_url = response.response_url
             postdata = self.get_form_data(response.webpage, dateobj, 'default.aspx')
@@ -410,8 +648,8 @@ class CentralWeekly(CentralBase):
         response = self.download_url(curr_url, savecookies = cookiejar, loadcookies=cookiejar, referer = curr_url, postdata = postdata)
 
         if not response or not response.webpage:
-            self.logger.warning('Could not fetch %s for the day %s', search_url, dateobj)
-            return dls
+            self.logger.warning('Could not fetch %s for the day %s', curr_url, dateobj)
+            return None
 
         curr_url = response.response_url
         postdata = self.get_form_data(response.webpage, dateobj, 'SearchMenu.aspx')
@@ -423,21 +661,47 @@ class CentralWeekly(CentralBase):
         response = self.download_url(curr_url, savecookies = cookiejar, \
                                      referer = curr_url, \
                                    loadcookies = cookiejar, postdata = postdata)           
+        if not response or not response.webpage:
+            return None
+
         curr_url = response.response_url
         form_href = curr_url.split('/')[-1]
         postdata = self.get_form_data(response.webpage, dateobj, form_href)
+        if postdata == None:
+            return None
+
         postdata = self.replace_field(postdata, '__EVENTTARGET', 'ddlGazetteCategory')
         response = self.download_url(curr_url, savecookies = cookiejar, \
                                      referer = curr_url, \
                                    loadcookies = cookiejar, postdata = postdata)           
-        curr_url = response.response_url
-        form_href = curr_url.split('/')[-1]
-        postdata = self.get_form_data(response.webpage, dateobj, form_href)
-        postdata.append(('ImgSubmitDetails.x', '63'))
-        postdata.append(('ImgSubmitDetails.y', '22'))
-        response = self.download_url(curr_url, savecookies = cookiejar, \
-                                     referer = curr_url, \
-                                   loadcookies = cookiejar, postdata = postdata)           
+        if not response or not response.webpage:
+            return None
+
+        return SearchSession(cookiejar, response.response_url, response.webpage)
+
+    def download_oneday(self, relpath, dateobj):
+        response = None
+        for attempt in range(2):
+            session = self.get_search_session(dateobj)
+            if session == None:
+                return []
+
+            response = self.submit_search(session, dateobj)
+            if response != None:
+                break
+            self.logger.info('Search state on %s has expired, navigating again for %s', \
+                             self.hostname, dateobj)
+
+        if response == None:
+            self.logger.warning('Could not search for the day %s', dateobj)
+            return []
+
+        dls = self.download_pages(relpath, dateobj, response, session.cookiejar)
+        self.put_search_session(session)
+        return dls
+
+    def download_pages(self, relpath, dateobj, response, cookiejar):
+        dls = []
         pagenum = 1
         while response != None and response.webpage != None:
             curr_url = response.response_url
@@ -448,8 +712,10 @@ class CentralWeekly(CentralBase):
 
             postdata = self.get_form_data(response.webpage, dateobj, form_href)
 
-            relurls = self.download_metainfos(relpath, metainfos, curr_url, \
-                                              postdata, cookiejar)
+            relurls = self.download_results(relpath, metainfos, curr_url, \
+                                            postdata, cookiejar)
+            if relurls == None:
+                break
             dls.extend(relurls)
             if nextpage:
                 pagenum += 1
@@ -163,10 +163,9 @@ class ChattisgarhWeekly(CentralBase):
 
         newpost = self.remove_fields(postdata, set(['ctl00$ContentPlaceHolder2$btnShow']))
 
-        session = self.get_session()
-        session.cookies = cookiejar
-        response = self.download_url_using_session(search_url, session=session, \
-                                                   postdata=newpost, referer=search_url)
+        response = self.download_url_using_session(search_url, postdata=newpost, \
+                                                   referer=search_url, \
+                                                   cookiejar=cookiejar)
         if response == None or response.webpage == None:
             self.logger.warning('Unable to post to get download page for %s', relurl) 
             return None
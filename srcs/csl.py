@@ -15,6 +15,8 @@ class CSLWeekly(CentralBase):
         self.result_table = 'GV_Content_Detail'
         self.gazette_js   = 'window.open\(\'(?P<href>[^\']+)'
         self.partnum      = '30'
+        # the yearly listings run into thousands of rows
+        self.parser       = utils.FAST_HTML
 
 
     def get_post_data(self, tags, dateobj):
@@ -3,23 +3,25 @@ import re
 import os
 from http.cookiejar import CookieJar
 
-from .central import CentralBase
+from .central import CentralWeekly, SearchSession
 from ..utils import utils
 
-class DelhiWeekly(CentralBase):
+class DelhiWeekly(CentralWeekly):
     def __init__(self, name, storage):
-        CentralBase.__init__(self, name, storage)
+        CentralWeekly.__init__(self, name, storage)
         self.baseurl     = 'https://egazette.gov.in'
+        self.todate_field  = None
+        self.submit_fields = [('ImgSubmitDetails_Delhi.x', '76'), \
+                              ('ImgSubmitDetails_Delhi.y', '20')]
 
-    def download_oneday(self, relpath, dateobj):
-        dls = []
+    def navigate_search(self, dateobj):
         cookiejar  = CookieJar()
         postdata = None
         while postdata == None:
             response = self.download_url(self.baseurl, savecookies = cookiejar, loadcookies = cookiejar)
             if not response:
                 self.logger.warning('Could not fetch %s for the day %s', self.baseurl, dateobj)
-                return dls
+                return None
 
             curr_url = response.response_url
             postdata = self.get_form_data(response.webpage, dateobj, 'default.aspx')
@@ -30,7 +32,7 @@ class DelhiWeekly(CentralBase):
                                      postdata = postdata)
         if not response:
             self.logger.warning('Could not fetch %s for the day %s', curr_url, dateobj)
-            return dls
+            return None
 
         curr_url = response.response_url
         state_url = urllib.parse.urljoin(curr_url, 'StateGazette.aspx')
@@ -41,13 +43,16 @@ class DelhiWeekly(CentralBase):
                                     loadcookies = cookiejar, referer = state_url)
 
         postdata = self.get_form_data(response.webpage, dateobj, 'DelhiGazette.aspx')
+        if postdata == None:
+            return None
+
         self.remove_fields(postdata, set(['Before_ePublish']))
         response = self.download_url(curr_url, savecookies = cookiejar, \
                                      loadcookies = cookiejar, referer = curr_url, \
                                      postdata = postdata)
         if not response:
             self.logger.warning('Could not fetch %s for the day %s', curr_url, dateobj)
-            return dls
+            return None
 
         state_url = curr_url
         curr_url = urllib.parse.urljoin(curr_url, 'SearchCategory.aspx')
@@ -56,40 +61,17 @@ class DelhiWeekly(CentralBase):
 
         postdata = self.get_form_data(response.webpage, dateobj, \
                                      'SearchCategory.aspx')
+        if postdata == None:
+            return None
+
         postdata = self.replace_field(postdata, '__EVENTTARGET', 'ddlGazetteCategory')
         response = self.download_url(curr_url, savecookies = cookiejar, \
                                      loadcookies = cookiejar, referer = curr_url, \
                                      postdata = postdata)
-        postdata = self.get_form_data(response.webpage, dateobj, \
-                                     'SearchCategory.aspx')
-        postdata.append(('ImgSubmitDetails_Delhi.x', '76'))
-        postdata.append(('ImgSubmitDetails_Delhi.y', '20'))
-        response = self.download_url(curr_url, savecookies = cookiejar, \
-                                     loadcookies = cookiejar, referer = curr_url, \
-                                     postdata = postdata)
-
-
-        pagenum = 1
-        while response != None and response.webpage != None:
-            curr_url = response.response_url
-            form_href = curr_url.split('/')[-1]
-
-            metainfos, nextpage = self.parse_search_results(response.webpage, \
-                                                            dateobj, pagenum)
-
-            postdata = self.get_form_data(response.webpage, dateobj, form_href)
-
-            relurls = self.download_metainfos(relpath, metainfos, curr_url, \
-                                              postdata, cookiejar)
-            dls.extend(relurls)
-            if nextpage:
-                pagenum += 1
-                self.logger.info('Going to page %d for date %s', pagenum, dateobj)
-                response = self.download_nextpage(nextpage, curr_url, postdata, cookiejar)
-            else:
-                break
+        if not response or not response.webpage:
+            return None
 
-        return dls
+        return SearchSession(cookiejar, response.response_url, response.webpage)
 
         
 class DelhiExtraordinary(DelhiWeekly):
@@ -3,6 +3,7 @@ import urllib.parse
 import urllib.error
 import re
 import os
+import functools
 
 from .basegazette import BaseGazette
 from ..utils import utils
@@ -13,8 +14,9 @@ class Goa(BaseGazette):
         self.hostname = 'goaprintingpress.gov.in'
         self.searchurl = 'https://goaprintingpress.gov.in/search-e-gazettes-by-date/?'\
                          'task=search_by_date&Itemid=177&type=ALL&series=ALL&sdate={0}&edate={0}&action=search'
+        self.independent_days = True
 
-    def download_gazette(self, metainfo, searchurl, relpath):
+    def get_gazette_item(self, metainfo, searchurl, relpath):
         link = metainfo.pop('download')
         href = link.get('href')
         txt  = utils.get_tag_contents(link)
@@ -28,18 +30,15 @@ class Goa(BaseGazette):
         relurl = os.path.join(relpath, txt)
 
         gzurl = urllib.parse.urljoin(searchurl, href)
-        if not self.save_gazette(relurl, gzurl, metainfo):
-            return None
-
-        return relurl
+        return relurl, gzurl, metainfo
 
     def download_metainfos(self, relpath, metainfos, searchurl):
-        dls = []
+        items = []
         for metainfo in metainfos:
-           relurl = self.download_gazette(metainfo, searchurl, relpath)
-           if relurl:
-                dls.append(relurl)
-        return dls
+           item = self.get_gazette_item(metainfo, searchurl, relpath)
+           if item:
+                items.append(item)
+        return self.save_gazettes(items)
 
     def get_field_order(self, tr):
         order = []
@@ -124,27 +123,25 @@ class Goa(BaseGazette):
         datestr   = dateobj.strftime('%d-%m-%Y')
         searchurl = self.searchurl.format(datestr)
 
-        response = self.download_url(searchurl)
-
-        pagenum = 1
-        while response is not None and response.webpage is not None:
-            curr_url = response.response_url
+        def parse_page(response, pagenum):
+            if response.webpage is None:
+                return (response.response_url, []), None
 
             metainfos, nextpage = self.parse_search_results(response.webpage, \
                                                             dateobj, pagenum)
+            if not nextpage:
+                return (response.response_url, metainfos), None
 
+            self.logger.info('Going to page %d for date %s', pagenum + 1, dateobj)
+            nexturl = urllib.parse.urljoin(searchurl, nextpage['href'])
+            return (response.response_url, metainfos), \
+                   functools.partial(self.download_url, nexturl)
+
+        fetch = functools.partial(self.download_url, searchurl)
+        for curr_url, metainfos in self.prefetch_pages(fetch, parse_page):
             relurls = self.download_metainfos(relpath, metainfos, curr_url)
 
             dls.extend(relurls)
-
-            if not nextpage:
-                break
-
-            pagenum += 1
-            self.logger.info('Going to page %d for date %s', pagenum, dateobj)
-
-            nexturl  = urllib.parse.urljoin(searchurl, nextpage['href'])
-            response = self.download_url(nexturl)
  
         return dls
 
@@ -24,6 +24,8 @@ class Haryana(AndhraArchive):
         self.captcha_field = 'ctl00$ContentPlaceHolder1$txtcaptcha'
         self.solve_captcha = decode_captcha.haryana_captcha
         self.search_button = 'ctl00$ContentPlaceHolder1$Button1'
+        # the results have no issue date to bucket a range by
+        self.todate_field  = None
         self.counter = 1
 
     def get_post_data(self, tags, dateobj):
@@ -14,6 +14,7 @@ class Himachal(Haryana):
         self.captcha_field = 'searchtext'
         self.solve_captcha = decode_captcha.himachal
         self.search_button = 'BtnSearch'
+        self.todate_field  = None
 
     def get_post_data(self, tags, dateobj):
         datestr  = utils.dateobj_to_str(dateobj, '/', reverse = False)
@@ -10,6 +10,7 @@ class Jharkhand(AndhraArchive):
         self.baseurl      = 'https://egazette.jharkhand.gov.in/SearchGazette.aspx'
         self.hostname     = 'egazette.jharkhand.gov.in'
         self.search_endp  = 'SearchGazette.aspx'
+        self.todate_field = None
 
         self.result_table = 'ctl00_ContentPlaceHolder1_DetailView'
 
@@ -15,6 +15,7 @@ class Karnataka(BaseGazette):
         self.hostname   = 'www.gazette.kar.nic.in'
         self.flip_date1 = datetime.date(2009, 0o3, 0o5)
         self.flip_date2 = datetime.date(2013, 0o3, 0o7)
+        self.independent_days = True
 
     def download_oneday(self, relpath, dateobj):
         dls = []
@@ -53,6 +54,7 @@ class Karnataka(BaseGazette):
 
         links = []
         linknames = []
+        items = []
         hrefs = utils.extract_links_from_pdf(BytesIO(response.webpage))
         for href in hrefs:
             reobj = re.search('(?P<num>Part-\w+)', href)
@@ -73,9 +75,9 @@ class Karnataka(BaseGazette):
 
             links.append(relurl)
             linknames.append(partnum)
+            items.append((relurl, docurl, metainfo))
 
-            if self.save_gazette(relurl, docurl, metainfo):
-                dls.append(relurl)
+        dls.extend(self.save_gazettes(items))
 
         mainmeta['links']     = links
         mainmeta['linknames'] = linknames
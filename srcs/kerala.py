@@ -3,15 +3,12 @@ import re
 import os
 import math
 import random
+import functools
 import urllib.request
 import urllib.parse
 import urllib.error
 from http.cookiejar import CookieJar, Cookie
 
-from calmjs.parse import es5
-from calmjs.parse.unparsers.extractor import ast_to_dict
-from calmjs.parse.asttypes import FunctionCall
-
 from .basegazette import BaseGazette
 from ..utils import utils
 
@@ -25,11 +22,131 @@ def tokenize(number):
     return token
 
 def get_callback_args(ast_dict):
+    from calmjs.parse.asttypes import FunctionCall
     try:
         return ast_dict[FunctionCall][0][0][1][FunctionCall][0][1]
     except Exception:
         return None
 
+# DWR replies are a call to r.handleCallback() whose last argument holds
+# the data as JS literals. The decoder below reads just those literals and
+# gives the same values as ast_to_dict does for them: strings, numbers,
+# true/false/null, arrays, objects as dicts and new Date(x) as
+# ['Date', [x]]. Anything else raises ValueError.
+
+JS_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', \
+              'v': '\v', '0': '\0'}
+JS_CONSTANTS = {'null': None, 'undefined': None, 'true': True, 'false': False}
+
+js_space  = re.compile(r'(\s+|//[^\n]*|/\*.*?\*/)+', re.S)
+js_number = re.compile(r'-?(0[xX][0-9a-fA-F]+|(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?)')
+js_ident  = re.compile(r'[A-Za-z_$][\w$]*')
+js_string = {'"': re.compile(r'(?:[^"\\]|\\.)*"', re.S), \
+             "'": re.compile(r"(?:[^'\\]|\\.)*'", re.S)}
+js_escape = re.compile(r'\\(u[0-9a-fA-F]{4}|x[0-9a-fA-F]{2}|.)', re.S)
+
+def unescape_js(match):
+    esc = match.group(1)
+    if esc[0] in 'ux' and len(esc) > 1:
+        return chr(int(esc[1:], 16))
+    return JS_ESCAPES.get(esc, esc)
+
+class DWRDecoder:
+    def __init__(self, text):
+        self.text = text
+        self.pos  = 0
+
+    def skip(self):
+        reobj = js_space.match(self.text, self.pos)
+        if reobj:
+            self.pos = reobj.end()
+
+    def peek(self):
+        self.skip()
+        if self.pos >= len(self.text):
+            raise ValueError('Unexpected end of reply')
+        return self.text[self.pos]
+
+    def expect(self, c):
+        if self.peek() != c:
+            raise ValueError('Expected %s at %d' % (c, self.pos))
+        self.pos += 1
+
+    def sequence(self, end, parse_item):
+        items = []
+        if self.peek() == end:
+            self.pos += 1
+            return items
+
+        while True:
+            items.append(parse_item())
+            c = self.peek()
+            self.pos += 1
+            if c == end:
+                return items
+            if c != ',':
+                raise ValueError('Expected , or %s at %d' % (end, self.pos - 1))
+
+    def value(self):
+        c = self.peek()
+        if c == '[':
+            self.pos += 1
+            return self.sequence(']', self.value)
+        if c == '{':
+            self.pos += 1
+            return dict(self.sequence('}', self.member))
+        if c in js_string:
+            return self.string()
+
+        reobj = js_number.match(self.text, self.pos)
+        if reobj:
+            self.pos = reobj.end()
+            num = reobj.group(0)
+            if re.match('-?0[xX]', num):
+                return int(num, 16)
+            if re.search('[.eE]', num):
+                return float(num)
+            return int(num)
+
+        ident = self.ident()
+        if ident in JS_CONSTANTS:
+            return JS_CONSTANTS[ident]
+        if ident == 'new' and self.ident() == 'Date':
+            self.expect('(')
+            return ['Date', self.sequence(')', self.value)]
+        raise ValueError('Unexpected %s at %d' % (ident, self.pos))
+
+    def ident(self):
+        self.skip()
+        reobj = js_ident.match(self.text, self.pos)
+        if not reobj:
+            raise ValueError('Unexpected character at %d' % self.pos)
+        self.pos = reobj.end()
+        return reobj.group(0)
+
+    def string(self):
+        quote = self.text[self.pos]
+        reobj = js_string[quote].match(self.text, self.pos + 1)
+        if not reobj:
+            raise ValueError('Unterminated string at %d' % self.pos)
+        self.pos = reobj.end()
+        return js_escape.sub(unescape_js, reobj.group(0)[:-1])
+
+    def member(self):
+        if self.peek() in js_string:
+            key = self.string()
+        else:
+            key = self.ident()
+        self.expect(':')
+        return (key, self.value())
+
+    def callback_args(self):
+        reobj = re.search(r'\.handleCallback\s*\(', self.text)
+        if not reobj:
+            raise ValueError('No handleCallback in reply')
+        self.pos = reobj.end()
+        return self.sequence(')', self.value)
+
 #   
 #   sample js 1
 #
@@ -66,16 +183,12 @@ class KeralaCompose(BaseGazette):
         self.hostname   = 'compose.kerala.gov.in'
 
     def parse_js_response(self, js_txt, dateobj):
-
         try:
-            js_resp = es5(js_txt)
-        except Exception:
-            self.logger.warning('Unable to parse response as js for %s', dateobj)
-            return None
-
-        ast_dict = ast_to_dict(js_resp)
+            callback_args = DWRDecoder(js_txt).callback_args()
+        except ValueError as e:
+            self.logger.info('Parsing the full js reply for %s: %s', dateobj, e)
+            callback_args = self.parse_js_ast(js_txt, dateobj)
 
-        callback_args = get_callback_args(ast_dict)
         if callback_args is None:
             self.logger.warning('Unable to get callback arguments for %s', dateobj)
             return None
@@ -86,6 +199,22 @@ class KeralaCompose(BaseGazette):
 
         return callback_args[2]
 
+    def parse_js_ast(self, js_txt, dateobj):
+        # calmjs is slow to import and to run, so it is only for replies
+        # the DWR decoder does not understand
+        from calmjs.parse import es5
+        from calmjs.parse.unparsers.extractor import ast_to_dict
+
+        try:
+            js_resp = es5(js_txt)
+        except Exception:
+            self.logger.warning('Unable to parse response as js for %s', dateobj)
+            return None
+
+        ast_dict = ast_to_dict(js_resp)
+
+        return get_callback_args(ast_dict)
+
 
     def make_dwr_call(self, script_name, method_name, cookiejar, curr_url, dateobj, \
                       sessionid = None, batchid = 0, extra_args = {}):
@@ -358,17 +487,23 @@ class Kerala(BaseGazette):
         if year == datetime.date.today().year:
             urls.append(self.latest_url)
 
-        for url in urls:
-            response = self.download_url(url)
-            if not response or not response.webpage:
-                self.logger.warning('Unable to download %s. Skipping %s to %s', url, fromdate, todate)
-                continue
-            d = utils.parse_webpage(response.webpage, self.parser)
+        def fetch(url):
+            return url, self.get_listing_page(url)
+
+        def parse_page(page, pagenum):
+            url, d = page
             if not d:
-                self.logger.warning('Unable to parse %s. Skipping %s to %s', url, fromdate, todate)
-                continue
+                self.logger.warning('Unable to get %s. Skipping %s to %s', url, fromdate, todate)
+                minfos = []
+            else:
+                minfos = self.process_listing_page(url, d, fromdate, todate)
+
+            if pagenum < len(urls):
+                return minfos, functools.partial(fetch, urls[pagenum])
+            return minfos, None
 
-            minfos = self.process_listing_page(url, d, fromdate, todate)
+        for minfos in self.prefetch_pages(functools.partial(fetch, urls[0]), \
+                                          parse_page):
             for metainfo in minfos:     
                 relurl = self.get_relurl(metainfo)
                 dateobj = metainfo.get_date()
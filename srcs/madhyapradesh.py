@@ -11,6 +11,7 @@ class MadhyaPradesh(BaseGazette):
         BaseGazette.__init__(self, name, storage)
         self.baseurl  = 'https://govtpressmp.nic.in/gazette.html'
         self.hostname = 'govtpressmp.nic.in'
+        self.independent_days = True
 
         self.extraordinary_url =  '/history-gazette-extra-%d.html'
         self.ordinary_urls = {\
@@ -31,14 +32,9 @@ class MadhyaPradesh(BaseGazette):
     def download_ordinary(self, dls, relpath, dateobj):
         for partnum, parturl in self.ordinary_urls:    
             parturl = urllib.parse.urljoin(self.baseurl, parturl % dateobj.year)
-            response = self.download_url(parturl)
-            if not response or not response.webpage:
-                self.logger.warning('Unable to download Ordinary gazette list for Part %s, year %d', partnum, dateobj.year)
-                continue
-
-            d = utils.parse_webpage(response.webpage, self.parser)
+            d = self.get_listing_page(parturl)
             if not d:    
-                self.logger.warning('Unable to parse Ordinary gazette list for Part %s, year %d', partnum, dateobj.year)
+                self.logger.warning('Unable to get Ordinary gazette list for Part %s, year %d', partnum, dateobj.year)
                 continue
             
             minfos = self.parse_listing_webpage(parturl, d, dateobj, partnum, 'Ordinary')
@@ -47,14 +43,9 @@ class MadhyaPradesh(BaseGazette):
     def download_extraordinary(self, dls, relpath, dateobj):
         ex_url = urllib.parse.urljoin(self.baseurl, self.extraordinary_url % dateobj.year)
 
-        response = self.download_url(ex_url)
-        if not response or not response.webpage:
-            self.logger.warning('Unable to download Extraordinary gazette for year %d', dateobj.year)
-            return
-
-        d = utils.parse_webpage(response.webpage, self.parser)
+        d = self.get_listing_page(ex_url)
         if not d:    
-            self.logger.warning('Unable to parse Extraordinary gazette list for year %d', dateobj.year)
+            self.logger.warning('Unable to get Extraordinary gazette list for year %d', dateobj.year)
             return
             
         if dateobj.year == 2010:
@@ -199,6 +190,7 @@ class MadhyaPradesh(BaseGazette):
         return None    
 
     def download_metainfos(self, minfos, dls, relpath):
+        items = []
         for metainfo in minfos:
             if not 'gztype' in metainfo or not 'gznum' in metainfo or \
                     not 'url' in metainfo:
@@ -211,6 +203,6 @@ class MadhyaPradesh(BaseGazette):
             filename, n = re.subn('\s+', '-', filename)
 
             relurl   = os.path.join(relpath, filename)
+            items.append((relurl, metainfo['url'], metainfo))
 
-            if self.save_gazette(relurl, metainfo['url'], metainfo):
-                dls.append(relurl)
+        dls.extend(self.save_gazettes(items))
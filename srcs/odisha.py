@@ -11,6 +11,7 @@ class Odisha(BaseGazette):
         BaseGazette.__init__(self, name, storage)
         self.baseurl = 'http://govtpress.odisha.gov.in/notdtsearch.asp'
         self.hostname = 'govtpress.odisha.gov.in'
+        self.independent_days = True
 
     def get_post_data(self, dateobj):
         return [('bsubmit', 'Submit'), ('select', utils.pad_zero(dateobj.day)),\
@@ -104,11 +105,13 @@ class Odisha(BaseGazette):
                 minfos.append(metainfo)
         
                     
+        items = []
         for metainfo in minfos:
             href   = metainfo.pop('href')
             url    = urllib.parse.urljoin(self.baseurl, href)
             relurl = os.path.join(relpath, metainfo['gznum'])
-            if self.save_gazette(relurl, url, metainfo):
-                dls.append(relurl)
+            items.append((relurl, url, metainfo))
+
+        dls.extend(self.save_gazettes(items))
 
         return dls        
@@ -13,6 +13,7 @@ class Punjab(BaseGazette):
         BaseGazette.__init__(self, name, storage)
         self.hostname  = 'esarkar.punjab.gov.in'
         self.searchurl = 'http://esarkar.punjab.gov.in/web/guest/customepage?p_p_id=guestPortlet&p_p_lifecycle=1&p_p_state=normal&p_p_mode=view&p_p_col_id=column-1&p_p_col_count=1&requestType=ApplicationRH&actionVal=searchRecord&queryType=Select&screenId=400176'
+        self.independent_days = True
        
     def get_post_data(self, dateobj):
         datestr = utils.dateobj_to_str(dateobj, '/')
@@ -148,6 +149,7 @@ class PunjabDSA(BaseGazette):
         self.baseurl = 'https://dsa.punjab.gov.in'
         self.dateurl = urllib.parse.urljoin(self.baseurl, '/egazette/api/Final/FinalFilter')
         self.gzurl   = urllib.parse.urljoin(self.baseurl, '/egazette/api/Final/Output_Copy')
+        self.independent_days = True
 
     def get_post_data(self, dateobj):
         datestr = utils.dateobj_to_str(dateobj, '-', reverse=True)
@@ -2,6 +2,7 @@ import datetime
 import re
 import os
 import calendar
+import functools
 
 from .kerala import Kerala
 from ..utils import utils
@@ -43,27 +44,31 @@ class StGeorge(Kerala):
     def results_page(self, relpath, webpage, year, fromdate, todate):
         dls = []
 
-        while 1:
+        def parse_page(webpage, pagenum):
             minfos, nextpage = self.parse_metainfos(webpage, year, \
                                                     fromdate, todate)
-            self.download_gazettes(relpath, minfos, dls)
+            if not nextpage:
+                return minfos, None
+
+            onclick = nextpage.get('onclick')
+            postdata = self.next_page_post(onclick, year)
+            if not postdata:
+                self.logger.warning('Unable to get postdata for next page from %s', onclick)
+                return minfos, None
 
-            if nextpage:
-                onclick = nextpage.get('onclick')
-                postdata = self.next_page_post(onclick, year)
-                if not postdata:
-                    self.logger.warning('Unable to get postdata for next page from %s', onclick)
-                    break
+            return minfos, functools.partial(self.download_results, postdata)
 
-                response = self.download_url(self.date_url, postdata = postdata)
-                if not response or not response.webpage:
-                    break
-                webpage = response.webpage
-            else:
-                break        
+        for minfos in self.prefetch_pages(lambda: webpage, parse_page):
+            self.download_gazettes(relpath, minfos, dls)
 
         return dls          
 
+    def download_results(self, postdata):
+        response = self.download_url(self.date_url, postdata = postdata)
+        if not response or not response.webpage:
+            return None
+        return response.webpage
+
 
     def download_gazettes(self, relpath, minfos, dls):
         for metainfo in minfos:
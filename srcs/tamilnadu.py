@@ -12,19 +12,15 @@ class TamilNadu(BaseGazette):
         self.hostname = 'www.stationeryprinting.tn.gov.in'
         self.baseurl  = 'https://www.stationeryprinting.tn.gov.in'
         self.archives_url = 'https://www.stationeryprinting.tn.gov.in/archives.php'
+        self.independent_days = True
 
     def get_links(self, dateobj):
         ordinary_url = None
         extraordinary_url = None
 
-        response = self.download_url(self.archives_url)
-        if response == None or response.webpage == None:
-            self.logger.warning('Could not fetch %s for the day %s', self.archive_url, dateobj)
-            return ordinary_url, extraordinary_url
-
-        d = utils.parse_webpage(response.webpage, self.parser)
+        d = self.get_listing_page(self.archives_url)
         if d == None:
-            self.logger.warning('Could not parse archive page for the day %s', dateobj)
+            self.logger.warning('Could not get archive page for the day %s', dateobj)
             return ordinary_url, extraordinary_url
 
         section = d.find('section', {'id': 'paragraph'})
@@ -72,6 +68,7 @@ class TamilNadu(BaseGazette):
         self.process_metainfos(metainfos, dls, relpath)
 
     def process_metainfos(self, metainfos, dls, relpath):
+        items = []
         for metainfo in metainfos:
             if 'gztype' not in metainfo or 'gznum' not in metainfo or \
                     'url' not in metainfo:
@@ -86,19 +83,26 @@ class TamilNadu(BaseGazette):
             filename, n = re.subn('\s+', '-', filename)
                 
             relurl = os.path.join(relpath, filename)
-            if self.save_gazette(relurl, metainfo.get_url(), metainfo):
-                dls.append(relurl)
-    
-    def get_result_table(self, url):
-        response = self.download_url(url)
-        if not response or not response.webpage:
-            self.logger.info('Unable to ftech the webpage for url: %s',  url)
-            return None 
+            items.append((relurl, metainfo.get_url(), metainfo))
 
-        d = utils.parse_webpage(response.webpage, self.parser)    
-        if not d:
-            self.logger.info('Unable to parse the webpage for url: %s',  url)
-            return None 
+        dls.extend(self.save_gazettes(items))
+    
+    def get_result_table(self, url, cached = False):
+        if cached:
+            d = self.get_listing_page(url)
+            if not d:
+                self.logger.info('Unable to get the webpage for url: %s',  url)
+                return None 
+        else:
+            response = self.download_url(url)
+            if not response or not response.webpage:
+                self.logger.info('Unable to ftech the webpage for url: %s',  url)
+                return None 
+
+            d = utils.parse_webpage(response.webpage, self.parser)    
+            if not d:
+                self.logger.info('Unable to parse the webpage for url: %s',  url)
+                return None 
 
         tables = d.find_all('table')
         
@@ -116,7 +120,8 @@ class TamilNadu(BaseGazette):
     def get_metainfos(self, href, dateobj, get_field_order, process_row):
         minfos = []
         url = urllib.parse.urljoin(self.baseurl, href)
-        result_table = self.get_result_table(url)
+        # the year table is read-only here, unlike the per issue listings
+        result_table = self.get_result_table(url, cached = True)
         if result_table == None:
             self.logger.warning('Unable to get result table for year %d', dateobj.year)
             return minfos
@@ -8,6 +8,7 @@ from requests_toolbelt.adapters.host_header_ssl import HostHeaderSSLAdapter
 
 from .basegazette import BaseGazette
 from ..utils import utils
+from ..utils import forms
 
 
 # needed because the DNS entries for the hostname is broken
@@ -95,7 +96,7 @@ class Telangana(BaseGazette):
  
 
     def get_search_form(self, webpage, endp):
-        d = utils.parse_webpage(webpage, self.parser)
+        d = forms.parse_page(webpage)
         if d == None:
             return None
 
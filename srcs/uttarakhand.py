@@ -6,6 +6,7 @@ from http.cookiejar import CookieJar
 
 from .basegazette import BaseGazette
 from ..utils import utils
+from ..utils import forms
 
 class Uttarakhand(BaseGazette):
     def __init__(self, name, storage):
@@ -17,7 +18,7 @@ class Uttarakhand(BaseGazette):
 
 	
     def get_search_form(self, webpage, endp):
-        d = utils.parse_webpage(webpage, self.parser)
+        d = forms.parse_page(webpage)
         if d == None:
             return None
 
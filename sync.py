@@ -8,15 +8,28 @@ import re
 
 from egazette.utils import utils
 from egazette.utils import download
+from egazette.utils import async_download
+from egazette.utils import cassette
 from egazette.utils.file_storage import FileManager
 from egazette.srcs import datasrcs
 
 def print_usage(progname):
     print('''Usage: %s [-l loglevel(critical, error, warn, info, debug)]
                        [-a (all_downloads)]
+                       [-e (asyncio engine, all srcs in one process)]
+                       [-c max_requests_per_host]
+                       [-w day_workers (parallel days for srcs that allow it)]
+                       [-L (adaptive per-host rate limiting)]
+                       [-W max_wait_secs]
+                       [-g grace_secs (after max_wait before crawlers are killed)]
+                       [-x cassette_dir (record the http traffic)]
+                       [-X cassette_dir (replay recorded traffic, no network)]
+                       [-M portal_url (crawl a mock portal, see tools/mockportal.py)]
                        [-m (updateMeta)]
                        [-n (no aggregation of srcs by hostname)]
                        [-r (updateRaw)]
+                       [-b (store identical gazettes once, as hardlinks)]
+                       [-j (journal the saved gazettes for iasync -j)]
                        [-f logfile]
                        [-t fromdate (DD-MM-YYYY)] [-T todate (DD-MM-YYYY)]
                        [-d last_n_days]
@@ -52,15 +65,27 @@ def to_datetime(datestr):
             datelist.append(int(num))
         return datetime.datetime(datelist[2], datelist[1], datelist[0])
 
-def execute(storage, srclist, agghosts, fromdate, todate, max_wait, all_dls):
+def execute(storage, srclist, agghosts, fromdate, todate, max_wait, all_dls, \
+            use_asyncio = False, max_per_host = 2, day_workers = 1, \
+            adaptive = False, grace_secs = 60, mock_url = None):
     if fromdate == None and todate != None:
         fromdate = todate
     elif fromdate != None and todate == None:
         todate = datetime.datetime.today()
 
     srcobjs = datasrcs.get_srcobjs(srclist,  storage)
-
-    download.parallel_download(srcobjs, agghosts, fromdate, todate, max_wait, all_dls)
+    if mock_url:
+        for obj in srcobjs:
+            obj.redirect(mock_url)
+
+    if use_asyncio:
+        async_download.parallel_download(srcobjs, fromdate, todate, max_wait, \
+                                         all_dls, max_per_host, day_workers, \
+                                         adaptive, grace_secs)
+    else:
+        download.parallel_download(srcobjs, agghosts, fromdate, todate, max_wait, all_dls, \
+                                   day_workers, max_per_host, adaptive, \
+                                   grace_secs)
 
 
 if __name__ == '__main__':
@@ -80,23 +105,45 @@ if __name__ == '__main__':
     all_dls    = False
     max_wait   = None
     agghosts   = True
-
-    optlist, remlist = getopt.getopt(sys.argv[1:], 'ad:D:l:mnf:p:t:T:hrs:W:')
+    use_asyncio  = False
+    max_per_host = 2
+    day_workers  = 1
+    adaptive     = False
+    grace_secs   = 60
+    dedup        = False
+    journal      = False
+    mock_url     = None
+
+    optlist, remlist = getopt.getopt(sys.argv[1:], 'abc:d:D:eg:jl:LmM:nf:p:t:T:hrs:w:W:x:X:')
     for o, v in optlist:
         if o == '-a':
             all_dls = True
+        elif o == '-b':
+            dedup = True
+        elif o == '-c':
+            max_per_host = int(v)
+        elif o == '-e':
+            use_asyncio = True
+        elif o == '-g':
+            grace_secs = int(v)
         elif o == '-d':   
             num_days = int(v)
             todate = datetime.datetime.today()
             fromdate = todate - datetime.timedelta(days = num_days)
         elif o == '-D':
             datadir = v
+        elif o == '-j':
+            journal = True
         elif o == '-l':
             debuglevel = v
+        elif o == '-L':
+            adaptive = True
         elif o == '-f':
             filename = v
         elif o == '-m':
             updateMeta = True
+        elif o == '-M':
+            mock_url = v
         elif o == '-n':
             agghosts = False
         elif o == '-t':
@@ -107,8 +154,14 @@ if __name__ == '__main__':
             updateRaw = True
         elif o == '-s':
             srclist.append(v)
+        elif o == '-w':
+            day_workers = int(v)
         elif o == '-W':
             max_wait = int(v)
+        elif o == '-x':
+            cassette.setup(cassette.RECORD, v)
+        elif o == '-X':
+            cassette.setup(cassette.REPLAY, v)
         else:
             print('Unknown option %s' % o, file=sys.stderr)
             print_usage(progname)
@@ -153,6 +206,8 @@ if __name__ == '__main__':
         # it is considered unsafe.. needs to be undone if we actually see crashes
         multiprocessing.set_start_method('fork')
 
-    storage = FileManager(datadir, updateMeta, updateRaw)
-    execute(storage, srclist, agghosts, fromdate, todate, max_wait, all_dls)
+    storage = FileManager(datadir, updateMeta, updateRaw, dedup, journal)
+    execute(storage, srclist, agghosts, fromdate, todate, max_wait, all_dls, \
+            use_asyncio, max_per_host, day_workers, adaptive, grace_secs, \
+            mock_url)
 
@@ -0,0 +1,92 @@
+import os
+import sys
+import logging
+import argparse
+
+from egazette.utils.file_storage import FileManager
+
+# Reports the raw documents that are byte identical across relurls and
+# moves existing trees into the blob store, see utils/blobstore.py
+
+logger = logging.getLogger('dedupe')
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(description='Find and link identical raw gazettes')
+
+    parser.add_argument('-a', '--action', dest='action', action='store',\
+                       default = 'report', help='action - report|dedupe|gc')
+    parser.add_argument('-D', '--datadir', dest='datadir', action='store',\
+                       required = True, help='gazette data directory')
+    parser.add_argument('-s', '--source', dest='srcnames', action='append',\
+                       default = [], help='sources to hash and link')
+    parser.add_argument('-n', '--num-groups', dest='num_groups', \
+                       action='store', type = int, default = 20, \
+                       help='number of duplicate groups to list')
+    return parser
+
+def report(storage, num_groups):
+    groups  = storage.catalog.get_duplicate_groups()
+    copies  = 0
+    wasted  = 0
+    for sha256, count, size, srcnames in groups:
+        inodes = set()
+        for relurl in storage.catalog.find_by_sha256(sha256):
+            try:
+                stat = os.stat(storage.get_rawfile_path(relurl))
+            except (OSError, TypeError):
+                continue
+            inodes.add((stat.st_dev, stat.st_ino))
+        copies += count - 1
+        if inodes:
+            wasted += (len(inodes) - 1) * (size or 0)
+
+    print('Identical documents: %d groups, %d extra copies' % (len(groups), copies))
+    print('Space held by unlinked copies: %d bytes (%.1f MB)' % \
+          (wasted, wasted / (1024 * 1024)))
+    print('')
+    for sha256, count, size, srcnames in groups[:num_groups]:
+        relurls = storage.catalog.find_by_sha256(sha256)
+        print('%s\t%d copies\t%d bytes\t%s' % (sha256[:16], count, size or 0, srcnames))
+        for relurl in relurls:
+            print('\t%s' % relurl)
+
+def dedupe(storage, srcnames):
+    linked = 0
+    for relurl, rawext, size, sha256 in storage.catalog.get_rawdocs(srcnames):
+        rawpath = storage.get_rawfile_path(relurl)
+        if sha256 == None or storage.blobstore.is_linked(rawpath, sha256):
+            continue
+        if storage.blobstore.add(rawpath, sha256):
+            linked += 1
+    logger.info('Linked %d copies to identical documents', linked)
+
+def gc(storage):
+    num = 0
+    for blobpath in storage.blobstore.find_orphans():
+        os.remove(blobpath)
+        num += 1
+    logger.info('Removed %d blobs no longer in raw/', num)
+
+if __name__ == '__main__':
+    parser = get_arg_parser()
+    args   = parser.parse_args()
+
+    logging.basicConfig(level = logging.INFO, \
+                        format = '%(asctime)s: %(name)s: %(levelname)s %(message)s')
+
+    storage = FileManager(args.datadir, False, False, dedup = True)
+    if not storage.catalog.is_built():
+        logger.error('No catalog in %s, build it with tools/rebuild_catalog.py', \
+                     args.datadir)
+        sys.exit(1)
+
+    if args.action == 'report':
+        storage.fill_hashes(args.srcnames)
+        report(storage, args.num_groups)
+    elif args.action == 'dedupe':
+        storage.fill_hashes(args.srcnames)
+        dedupe(storage, args.srcnames)
+    elif args.action == 'gc':
+        gc(storage)
+    else:
+        parser.print_help()
@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import operator
+import functools
+import argparse
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from egazette.utils.file_storage import FileManager
+
+# Exports the metadata of the archive to parquet files partitioned by
+# source and year (outdir/source=<src>/year=<yyyy>/part.parquet) so that
+# questions over all the gazettes are a scan of a few columns. Runs after
+# the first only re-export the documents the catalog saw change since the
+# last export of their source, and drop the rows of documents no longer
+# in the catalog.
+
+logger = logging.getLogger('metaexport')
+
+FIELDS = ['gztype', 'gznum', 'ministry', 'department', 'subject']
+
+SCHEMA = pa.schema([('relurl', pa.string()), ('date', pa.date32())] + \
+                   [(field, pa.string()) for field in FIELDS] + \
+                   [('size', pa.int64()), ('sha256', pa.string())])
+
+MANIFEST = '_manifest.json'
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(description='Export gazette metadata to parquet and query it')
+
+    parser.add_argument('-a', '--action', dest='action', action='store',\
+                       default = 'export', help='action - export|query')
+    parser.add_argument('-o', '--outdir', dest='outdir', action='store',\
+                       required = True, help='directory of the parquet dataset')
+    parser.add_argument('-D', '--datadir', dest='datadir', action='store',\
+                       help='gazette data directory to export')
+    parser.add_argument('-s', '--source', dest='srcnames', action='append',\
+                       default = [], help='sources to export or query')
+    parser.add_argument('-F', '--full', dest='full', action='store_true',\
+                       help='export everything again')
+    parser.add_argument('-y', '--year', dest='years', action='append',\
+                       type = int, default = [], help='years to query')
+    parser.add_argument('-w', '--where', dest='conditions', action='append',\
+                       default = [], help='field=value conditions for the query')
+    parser.add_argument('-g', '--group-by', dest='groupby', action='store',\
+                       help='comma separated fields to count the gazettes by')
+    parser.add_argument('-c', '--columns', dest='columns', action='store',\
+                       default = 'relurl,date,gztype,subject', \
+                       help='comma separated fields to print')
+    parser.add_argument('-n', '--limit', dest='limit', action='store',\
+                       type = int, default = 100, help='number of rows to print')
+    return parser
+
+def load_manifest(outdir):
+    filepath = os.path.join(outdir, MANIFEST)
+    if not os.path.exists(filepath):
+        return {}
+
+    with open(filepath, 'r') as f:
+        return json.load(f)
+
+def save_manifest(outdir, manifest):
+    os.makedirs(outdir, exist_ok = True)
+    filepath = os.path.join(outdir, MANIFEST)
+    tmppath  = '%s.tmp' % filepath
+    with open(tmppath, 'w') as f:
+        json.dump(manifest, f, indent = 1)
+    os.replace(tmppath, filepath)
+
+def to_str(value):
+    if value == None:
+        return None
+    if isinstance(value, list):
+        return '; '.join(to_str(v) for v in value if v != None)
+    if isinstance(value, dict):
+        return json.dumps(value, sort_keys = True)
+    return '%s' % value
+
+def to_record(docinfo, metainfo):
+    record = {'relurl': docinfo['relurl'], 'size': docinfo['size'], \
+              'sha256': docinfo['sha256'], 'date': metainfo.get('date')}
+    for field in FIELDS:
+        record[field] = to_str(metainfo.get(field))
+    return record
+
+def get_partition_path(outdir, srcname, year):
+    return os.path.join(outdir, 'source=%s' % srcname, 'year=%d' % year, \
+                        'part.parquet')
+
+def write_partition(filepath, table):
+    if table.num_rows == 0:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        # an empty year= directory would be read as a partition
+        dirname = os.path.dirname(filepath)
+        if os.path.isdir(dirname) and not os.listdir(dirname):
+            os.rmdir(dirname)
+        return
+
+    os.makedirs(os.path.dirname(filepath), exist_ok = True)
+    tmppath = '%s.tmp' % filepath
+    pq.write_table(table.sort_by('relurl'), tmppath, compression = 'zstd')
+    os.replace(tmppath, filepath)
+
+def update_source(outdir, srcname, records, full, live):
+    # parquet files are not updated in place, a partition with a changed
+    # or a removed document is written again without its old row
+    changed = pa.array([record['relurl'] for record in records], pa.string())
+    live    = pa.array(live, pa.string())
+
+    tables = {}
+    srcdir = os.path.join(outdir, 'source=%s' % srcname)
+    if not full and os.path.isdir(srcdir):
+        for dirname in os.listdir(srcdir):
+            if not dirname.startswith('year='):
+                continue
+            year     = int(dirname[5:])
+            filepath = get_partition_path(outdir, srcname, year)
+            if not os.path.exists(filepath):
+                continue
+            table = pq.read_table(filepath, schema = SCHEMA)
+            kept  = table.filter(pc.invert(pc.is_in(table['relurl'], changed)))
+            kept  = kept.filter(pc.is_in(kept['relurl'], live))
+            if kept.num_rows != table.num_rows:
+                tables[year] = kept
+
+    byyear = {}
+    for record in records:
+        dateobj = record['date']
+        year = dateobj.year if dateobj != None else 0
+        byyear.setdefault(year, []).append(record)
+
+    for year, yrecords in byyear.items():
+        if year not in tables:
+            filepath = get_partition_path(outdir, srcname, year)
+            if not full and os.path.exists(filepath):
+                tables[year] = pq.read_table(filepath, schema = SCHEMA)
+            else:
+                tables[year] = SCHEMA.empty_table()
+        newtable = pa.Table.from_pylist(yrecords, schema = SCHEMA)
+        tables[year] = pa.concat_tables([tables[year], newtable])
+
+    for year, table in tables.items():
+        write_partition(get_partition_path(outdir, srcname, year), table)
+    return len(tables)
+
+def get_exported_sources(outdir):
+    if not os.path.isdir(outdir):
+        return []
+    return [d[7:] for d in os.listdir(outdir) if d.startswith('source=')]
+
+def clear_source(outdir, srcname):
+    shutil.rmtree(os.path.join(outdir, 'source=%s' % srcname))
+
+def export(datadir, outdir, srcnames, full, batch_size = 5000):
+    storage  = FileManager(datadir, False, False)
+    if not storage.catalog.is_built():
+        logger.error('No catalog in %s, build it with tools/rebuild_catalog.py', datadir)
+        return
+    manifest = load_manifest(outdir)
+    # exported_ts of each source, a manifest of older runs has one for all
+    exported = manifest.setdefault('sources', {})
+
+    # documents saved while this runs are picked up again the next time
+    export_ts = time.time()
+
+    if not srcnames:
+        srcnames = storage.catalog.get_srcnames()
+        for srcname in get_exported_sources(outdir):
+            if srcname not in srcnames:
+                logger.info('Removing %s, no longer in the catalog', srcname)
+                clear_source(outdir, srcname)
+                exported.pop(srcname, None)
+
+    if full:
+        # a full export starts afresh so that no row of a document gone
+        # from the catalog survives it
+        for srcname in get_exported_sources(outdir):
+            if srcname in srcnames:
+                clear_source(outdir, srcname)
+
+    # rows exported before their document was hashed are written again
+    hashed = {}
+    for relurl in storage.fill_hashes(srcnames):
+        hashed.setdefault(relurl.split('/')[0], []).append(relurl)
+
+    for srcname in srcnames:
+        start_ts = None
+        if not full:
+            start_ts = exported.get(srcname, manifest.get('exported_ts'))
+
+        docinfos = list(storage.catalog.find_docinfos(srcname, start_ts))
+        seen     = set(d['relurl'] for d in docinfos)
+        for relurl in hashed.get(srcname, []):
+            docinfo = storage.catalog.get_docinfo(relurl)
+            if relurl not in seen and docinfo['meta_mtime'] != None:
+                docinfos.append(docinfo)
+
+        live = [d['relurl'] for d in storage.catalog.find_docinfos(srcname, None)]
+
+        records = []
+        for i in range(0, len(docinfos), batch_size):
+            batch     = docinfos[i:i + batch_size]
+            metainfos = storage.get_metainfos([d['relurl'] for d in batch])
+            for docinfo, metainfo in zip(batch, metainfos):
+                if metainfo != None:
+                    records.append(to_record(docinfo, metainfo))
+
+        num = update_source(outdir, srcname, records, full, live)
+        logger.info('Exported %d documents of %s to %d partitions', \
+                    len(records), srcname, num)
+        exported[srcname] = export_ts
+
+    save_manifest(outdir, manifest)
+
+def get_filter(srcnames, years, conditions):
+    exprs = []
+    if srcnames:
+        exprs.append(ds.field('source').isin(srcnames))
+    if years:
+        exprs.append(ds.field('year').isin(years))
+    for condition in conditions:
+        field, value = condition.split('=', 1)
+        exprs.append(ds.field(field) == value)
+
+    if not exprs:
+        return None
+    return functools.reduce(operator.and_, exprs)
+
+def query(outdir, srcnames, years, conditions, groupby, columns, limit):
+    dataset = ds.dataset(outdir, format = 'parquet', partitioning = 'hive')
+    expr    = get_filter(srcnames, years, conditions)
+
+    if groupby:
+        keys  = groupby.split(',')
+        table = dataset.to_table(columns = keys + ['relurl'], filter = expr)
+        table = table.group_by(keys).aggregate([('relurl', 'count')])
+        table = table.sort_by([('relurl_count', 'descending')])
+        columns = keys + ['relurl_count']
+    else:
+        columns = columns.split(',')
+        table = dataset.head(limit, columns = columns, filter = expr)
+
+    print('\t'.join(columns))
+    for row in table.slice(0, limit).to_pylist():
+        print('\t'.join('%s' % row[c] for c in columns))
+
+if __name__ == '__main__':
+    parser = get_arg_parser()
+    args   = parser.parse_args()
+
+    logging.basicConfig(level = logging.INFO, \
+                        format = '%(asctime)s: %(name)s: %(levelname)s %(message)s')
+
+    if args.action == 'export':
+        if not args.datadir:
+            print('Please specify the gazette data directory to export')
+            sys.exit(0)
+        export(args.datadir, args.outdir, args.srcnames, args.full)
+    elif args.action == 'query':
+        query(args.outdir, args.srcnames, args.years, args.conditions, \
+              args.groupby, args.columns, args.limit)
+    else:
+        parser.print_help()
@@ -0,0 +1,435 @@
+import re
+import sys
+import time
+import zlib
+import struct
+import random
+import socket
+import getopt
+import hashlib
+import datetime
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# A stand-in for the gazette portals to load test the crawlers against.
+# It serves the ASP.NET search flow of CentralBase (ViewState, postbacks
+# and __doPostBack paging on tbl_Gazette, window.open to a viewer page
+# with the framePDFDisplay iframe), a Handler.ashx captcha, the DWR calls
+# of KeralaCompose and the gazette PDFs with Range support. Crawl it with
+#   python sync.py -M http://127.0.0.1:8000 -s keralacompose ...
+# which rewrites the urls on the portal host of each source to it. The
+# menus that central_weekly goes through before the search form are not
+# served. Throttling bursts, slow bodies and dropped connections are
+# injected at the configured rates.
+
+def print_usage(progname):
+    print('''Usage: %s [-p port (default 8000)]
+                       [-n gazettes_per_day (default 100)]
+                       [-P results_per_page (default 50)]
+                       [-S gazette_size_kb (default 256)]
+                       [-V viewstate_kb (default 64)]
+                       [-e throttle_rate (chance of a 503/403 burst)]
+                       [-b burst_length (requests, default 20)]
+                       [-s slow_rate (chance of a slow body)]
+                       [-x disconnect_rate (chance of a dropped body)]
+                       [-l latency_ms (added to every response)]
+                       [-r seed]
+                       ''' % progname)
+
+class Config:
+    def __init__(self):
+        self.per_day         = 100
+        self.page_size       = 50
+        self.gazette_size    = 256 * 1024
+        self.viewstate_size  = 64 * 1024
+        self.throttle_rate   = 0.0
+        self.burst_length    = 20
+        self.slow_rate       = 0.0
+        self.disconnect_rate = 0.0
+        self.latency         = 0.0
+        self.chunk_size      = 16 * 1024
+
+class PortalState:
+    def __init__(self, config, seed):
+        self.config   = config
+        self.random   = random.Random(seed)
+        self.lock     = threading.Lock()
+        self.sessions = set()
+        self.burst    = 0
+        self.burst_status = 503
+        self.stats    = {}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def chance(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def throttle(self):
+        # bursts of errors across all clients, like an overloaded portal
+        with self.lock:
+            if self.burst > 0:
+                self.burst -= 1
+                return self.burst_status
+            if self.random.random() < self.config.throttle_rate:
+                self.burst = self.config.burst_length - 1
+                self.burst_status = self.random.choice([503, 403])
+                return self.burst_status
+        return None
+
+    def new_session(self):
+        with self.lock:
+            sessionid = '%032x' % self.random.getrandbits(128)
+            self.sessions.add(sessionid)
+        return sessionid
+
+    def has_session(self, sessionid):
+        with self.lock:
+            return sessionid in self.sessions
+
+def gazette_ids(dateobj, config):
+    return ['%s%05d' % (dateobj.strftime('%Y%m%d'), i) \
+            for i in range(config.per_day)]
+
+def gazette_body(gzid, size):
+    # deterministic so that resumed downloads line up
+    seed = hashlib.sha256(gzid.encode('utf-8')).digest()
+    block = b''.join(hashlib.sha256(seed + struct.pack('>I', i)).digest() \
+                     for i in range(128))
+    body = b'%PDF-1.4\n' + block * (size // len(block) + 1)
+    return body[:size]
+
+def get_egz_date(dateobj):
+    return dateobj.strftime('%d-%b-%Y')
+
+def parse_dates(fields):
+    dates = []
+    for name, values in fields.items():
+        for value in values:
+            for fmt in ['%d-%b-%Y', '%d-%m-%Y', '%d/%m/%Y', '%Y-%m-%d']:
+                try:
+                    dates.append(datetime.datetime.strptime(value, fmt).date())
+                    break
+                except ValueError:
+                    pass
+    return dates
+
+def make_png(width, height, seed):
+    rnd = random.Random(seed)
+    rows = b''.join(b'\x00' + bytes(rnd.randrange(256) for i in range(width)) \
+                    for j in range(height))
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + \
+               struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    return b'\x89PNG\r\n\x1a\n' + \
+           chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)) + \
+           chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b'')
+
+class PortalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def get_session(self):
+        cookie = self.headers.get('Cookie') or ''
+        reobj = re.search('ASP.NET_SessionId=(?P<id>\w+)', cookie)
+        if reobj and self.server.state.has_session(reobj.group('id')):
+            return reobj.group('id'), False
+        return self.server.state.new_session(), True
+
+    def send_body(self, status, body, ctype = 'text/html; charset=utf-8', \
+                  headers = []):
+        self.send_response(status)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', '%d' % len(body))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def read_fields(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length).decode('utf-8', 'ignore')
+        if self.headers.get('Content-Type', '').startswith('text/plain'):
+            # DWR posts key=value lines
+            fields = {}
+            for line in data.splitlines():
+                k, sep, v = line.partition('=')
+                fields.setdefault(k, []).append(v)
+            return fields
+        return urllib.parse.parse_qs(data, keep_blank_values = True)
+
+    def pre_response(self):
+        state = self.server.state
+        state.count('requests')
+        if state.config.latency:
+            time.sleep(state.config.latency)
+
+        status = state.throttle()
+        if status != None:
+            state.count(status)
+            self.send_body(status, b'Service busy', \
+                           headers = [('Retry-After', '5')])
+            return False
+        return True
+
+    def do_GET(self):
+        if not self.pre_response():
+            return
+
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        path = url.path
+
+        if path in ['/', '/default.aspx', '/SearchCategory.aspx']:
+            self.search_page(None, None, 1)
+        elif path == '/PdfViewer.aspx':
+            gzid = query.get('id', [''])[0]
+            body = '<html><body><iframe id="framePDFDisplay" src="/Gazettes/%s.pdf"></iframe></body></html>' % gzid
+            self.send_body(200, body.encode('utf-8'))
+        elif path.startswith('/Gazettes/') and path.endswith('.pdf'):
+            self.send_gazette(path.split('/')[-1][:-4])
+        elif path == '/kgSearchfiledownloadpdf':
+            self.send_gazette(query.get('searchpdfid', [''])[0])
+        elif path == '/Handler.ashx':
+            seed = self.server.state.random.random()
+            self.send_body(200, make_png(120, 40, seed), 'image/png')
+        elif path == '/egazettelink1':
+            body = '<html><body><form id="downloadform" action="kgSearchfiledownloadpdf"><input name="searchpdfid"/><input name="type"/></form></body></html>'
+            self.send_body(200, body.encode('utf-8'))
+        else:
+            self.send_body(404, b'Not found')
+
+    def do_POST(self):
+        if not self.pre_response():
+            return
+
+        path   = urllib.parse.urlparse(self.path).path
+        fields = self.read_fields()
+
+        if path.startswith('/dwr/call/plaincall/'):
+            self.dwr_call(path.split('/')[-1], fields)
+        elif path in ['/', '/default.aspx', '/SearchCategory.aspx']:
+            self.postback(fields)
+        else:
+            self.send_body(404, b'Not found')
+
+    def postback(self, fields):
+        sessionid, is_new = self.get_session()
+        if is_new or '__VIEWSTATE' not in fields:
+            # the state of an expired session is thrown out
+            self.send_response(302)
+            self.send_header('Location', '/default.aspx')
+            self.send_header('Set-Cookie', 'ASP.NET_SessionId=%s; path=/; HttpOnly' % sessionid)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        dates = parse_dates(fields)
+        if not dates:
+            self.search_page(None, None, 1)
+            return
+        fromdate, todate = min(dates), max(dates)
+
+        for name in fields:
+            reobj = re.match('gvResults\$ctl(?P<idx>\d+)\$imgbtn\.x$', name)
+            if reobj:
+                self.view_gazette(fromdate, todate, fields, int(reobj.group('idx')))
+                return
+
+        pagenum = 1
+        target  = fields.get('__EVENTTARGET', [''])[0]
+        reobj = re.match('Page\$(?P<num>\d+)$', fields.get('__EVENTARGUMENT', [''])[0])
+        if target == 'gvResults' and reobj:
+            pagenum = int(reobj.group('num'))
+
+        self.search_page(fromdate, todate, pagenum)
+
+    def get_results(self, fromdate, todate):
+        results = []
+        dateobj = fromdate
+        while dateobj <= todate:
+            for gzid in gazette_ids(dateobj, self.server.state.config):
+                results.append((dateobj, gzid))
+            dateobj += datetime.timedelta(days = 1)
+        return results
+
+    def view_gazette(self, fromdate, todate, fields, idx):
+        config  = self.server.state.config
+        pagenum = int(fields.get('hdnPage', ['1'])[0])
+        results = self.get_results(fromdate, todate)
+        pos = (pagenum - 1) * config.page_size + idx
+        if pos >= len(results):
+            self.send_body(404, b'No such gazette')
+            return
+
+        self.server.state.count('views')
+        gzid = results[pos][1]
+        body = "<html><script>window.open('PdfViewer.aspx?id=%s');</script></html>" % gzid
+        self.send_body(200, body.encode('utf-8'))
+
+    def search_page(self, fromdate, todate, pagenum):
+        config  = self.server.state.config
+        sessionid, is_new = self.get_session()
+        headers = []
+        if is_new:
+            headers.append(('Set-Cookie', 'ASP.NET_SessionId=%s; path=/; HttpOnly' % sessionid))
+
+        viewstate = '%x' % self.server.state.random.getrandbits(128)
+        viewstate = (viewstate * (config.viewstate_size // len(viewstate) + 1))[:config.viewstate_size]
+
+        datestr = ''
+        todatestr = ''
+        if fromdate != None:
+            datestr   = get_egz_date(fromdate)
+            todatestr = get_egz_date(todate)
+
+        parts = ['<html><body><form method="post" action="./SearchCategory.aspx" id="form1">', \
+                 '<input type="hidden" name="__EVENTTARGET" value=""/>', \
+                 '<input type="hidden" name="__EVENTARGUMENT" value=""/>', \
+                 '<input type="hidden" name="__VIEWSTATE" value="%s"/>' % viewstate, \
+                 '<input type="hidden" name="__EVENTVALIDATION" value="%s"/>' % viewstate[:64], \
+                 '<input type="hidden" name="hdnPage" value="%d"/>' % pagenum, \
+                 '<input type="text" name="txtDateFrom" value="%s"/>' % datestr, \
+                 '<input type="text" name="txtDateTo" value="%s"/>' % todatestr, \
+                 '<select name="ddlGazetteCategory"><option value="Weekly">Weekly</option><option value="Extra Ordinary">Extra Ordinary</option></select>', \
+                 '<select name="ddlPartSection"><option selected="selected" value="Select Part">Select Part</option></select>', \
+                 '<input type="submit" name="btnDetail" value="Detailed Report"/>']
+
+        if fromdate != None:
+            results  = self.get_results(fromdate, todate)
+            numpages = max(1, (len(results) + config.page_size - 1) // config.page_size)
+            start    = (pagenum - 1) * config.page_size
+
+            parts.append('<table id="tbl_Gazette"><tr><th>Ministry</th><th>Subject</th><th>Gazette ID</th><th>Issue Date</th><th>Download</th></tr>')
+            for idx, (dateobj, gzid) in enumerate(results[start:start + config.page_size]):
+                parts.append('<tr><td>Ministry of Testing</td><td>Notification %s</td><td>CG-DL-E-%s</td><td>%s</td><td><input type="image" name="gvResults$ctl%02d$imgbtn" src="pdf.png"/></td></tr>' % \
+                             (gzid, gzid, dateobj.strftime('%d/%m/%Y'), idx))
+
+            if numpages > 1:
+                parts.append('<tr class="pager"><td colspan="5"><table><tr>')
+                for num in range(1, numpages + 1):
+                    if num == pagenum:
+                        parts.append('<td><span>%d</span></td>' % num)
+                    else:
+                        parts.append("<td><a href=\"javascript:__doPostBack('gvResults','Page$%d')\">%d</a></td>" % (num, num))
+                parts.append('</tr></table></td></tr>')
+            parts.append('</table>')
+            self.server.state.count('searches')
+
+        parts.append('</form></body></html>')
+        self.send_body(200, ''.join(parts).encode('utf-8'), headers = headers)
+
+    def dwr_call(self, name, fields):
+        if name.startswith('__System.generateId'):
+            reply = '"%032X"' % self.server.state.random.getrandbits(128)
+        else:
+            dates = []
+            for k in ['c0-param16', 'c0-param0']:
+                for value in fields.get(k, []):
+                    value = value.split(':', 1)[-1]
+                    try:
+                        dates.append(datetime.datetime.strptime(value, '%Y-%m-%d').date())
+                    except ValueError:
+                        pass
+            if not dates:
+                dates = [datetime.date.today()]
+
+            rows = []
+            for i, gzid in enumerate(gazette_ids(dates[0], self.server.state.config)):
+                epoch = datetime.datetime.combine(dates[0], datetime.time()).timestamp()
+                rows.append('[null,%d,%d,%s,"Department %d",new Date(%d),"Office","Subject of %s"]' % \
+                            (i, dates[0].year, gzid, i % 10, epoch * 1000, gzid))
+            reply = '[%s]' % ','.join(rows)
+
+        body = '//#DWR-INSERT\n//#DWR-REPLY\n(function(){\nvar r=window.dwr._[0];\nr.handleCallback("0","0",%s);\n})();\n' % reply
+        self.send_body(200, body.encode('utf-8'), 'text/javascript')
+
+    def send_gazette(self, gzid):
+        state = self.server.state
+        body  = gazette_body(gzid, state.config.gazette_size)
+
+        start = 0
+        reobj = re.match('bytes=(?P<start>\d+)-$', self.headers.get('Range', ''))
+        if reobj and int(reobj.group('start')) < len(body):
+            start = int(reobj.group('start'))
+
+        self.send_response(206 if start else 200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', '%d' % (len(body) - start))
+        self.send_header('ETag', '"%s"' % gzid)
+        self.send_header('Accept-Ranges', 'bytes')
+        if start:
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(body) - 1, len(body)))
+        self.end_headers()
+        state.count('gazettes')
+
+        slow = state.chance(state.config.slow_rate)
+        drop = state.chance(state.config.disconnect_rate)
+        if drop:
+            # cut the transfer somewhere in the middle
+            end = start + (len(body) - start) // 2
+            state.count('disconnects')
+        else:
+            end = len(body)
+
+        for pos in range(start, end, state.config.chunk_size):
+            if slow:
+                time.sleep(0.2)
+            self.wfile.write(body[pos:min(end, pos + state.config.chunk_size)])
+
+        if drop:
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+
+if __name__ == '__main__':
+    progname = sys.argv[0]
+    port     = 8000
+    seed     = 0
+    config   = Config()
+
+    optlist, remlist = getopt.getopt(sys.argv[1:], 'b:e:hl:n:p:P:r:s:S:V:x:')
+    for o, v in optlist:
+        if o == '-b':
+            config.burst_length = int(v)
+        elif o == '-e':
+            config.throttle_rate = float(v)
+        elif o == '-l':
+            config.latency = int(v) / 1000.0
+        elif o == '-n':
+            config.per_day = int(v)
+        elif o == '-p':
+            port = int(v)
+        elif o == '-P':
+            config.page_size = int(v)
+        elif o == '-r':
+            seed = int(v)
+        elif o == '-s':
+            config.slow_rate = float(v)
+        elif o == '-S':
+            config.gazette_size = int(v) * 1024
+        elif o == '-V':
+            config.viewstate_size = int(v) * 1024
+        elif o == '-x':
+            config.disconnect_rate = float(v)
+        else:
+            print_usage(progname)
+            sys.exit(0)
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), PortalHandler)
+    server.daemon_threads = True
+    server.state = PortalState(config, seed)
+    print('Mock portal on http://127.0.0.1:%d/' % port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(server.state.stats)
@@ -0,0 +1,15 @@
+import sys
+import logging
+from egazette.utils.file_storage import FileManager
+
+# builds the catalog of a data directory, which tools/metaexport.py and
+# tools/dedupe.py need, and rescans raw/ and metatags/ after files were
+# added or removed by hand
+
+if __name__ == '__main__':
+    progname = sys.argv[0]
+    datadir  = sys.argv[1]
+
+    logging.basicConfig(level = logging.INFO)
+    storage = FileManager(datadir, False, False)
+    storage.rebuild_catalog()
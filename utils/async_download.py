@@ -0,0 +1,112 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .throttle import HostSlots, AdaptiveLimiter
+
+logger = logging.getLogger('crawler.controller')
+
+def get_date_range(obj, fromdate, todate, all_dls):
+    if all_dls:
+        return obj.get_all_range()
+    if fromdate == None and todate == None:
+        return obj.get_daily_range()
+    return fromdate, todate
+
+async def download_days(obj, fromdate, todate, event, max_days):
+    semaphore = asyncio.Semaphore(max_days)
+
+    async def download_day(dateobj):
+        async with semaphore:
+            if event.is_set():
+                return []
+            return await asyncio.to_thread(obj.download_day, dateobj)
+
+    dates = obj.get_dates(fromdate, todate)
+
+    results = await asyncio.gather(*[download_day(d) for d in dates])
+    if event.is_set():
+        obj.logger.warning('Exiting prematurely as timer event is set')
+        obj.checkpoint()
+
+    newdownloads = []
+    for dls in results:
+        newdownloads.extend(dls)
+    return newdownloads
+
+async def download_src(obj, fromdate, todate, event, max_days, daily):
+    try:
+        if obj.independent_days:
+            dls = await download_days(obj, fromdate, todate, event, max_days)
+        else:
+            dls = await asyncio.to_thread(obj.sync, fromdate, todate, event)
+
+        if daily:
+            dls.extend(await asyncio.to_thread(obj.replay_ledger, \
+                                               fromdate.date(), event))
+        dls.extend(await asyncio.to_thread(obj.drain_retries, event))
+        return dls
+    except Exception:
+        obj.logger.exception('Crawl of %s failed', obj.name)
+        return []
+
+async def crawl(gazetteobjs, fromdate, todate, max_wait, all_dls, \
+                max_per_host, day_workers, adaptive, grace_secs, event):
+    hostnames = set([obj.hostname for obj in gazetteobjs])
+    num_workers = max(1, len(gazetteobjs) * day_workers + \
+                         len(hostnames) * max_per_host)
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers = num_workers))
+
+    if adaptive:
+        host_slots = AdaptiveLimiter(hostnames, max_per_host)
+    else:
+        host_slots = HostSlots(max_per_host)
+
+    tasks = []
+    for obj in gazetteobjs:
+        obj.set_event(event)
+        obj.set_day_workers(day_workers)
+        obj.set_host_slots(host_slots)
+        start, end = get_date_range(obj, fromdate, todate, all_dls)
+        daily = not all_dls and fromdate == None and todate == None
+        task = asyncio.create_task(download_src(obj, start, end, event, \
+                                                day_workers, daily))
+        tasks.append(task)
+
+    if not tasks:
+        return []
+
+    done, pending = await asyncio.wait(tasks, timeout = max_wait)
+    if pending:
+        logger.warning('Time expired. Setting the event and asking the crawlers to exit')
+        event.set()
+        done, pending = await asyncio.wait(pending, timeout = grace_secs)
+
+    if event.is_set():
+        # days left pending by crawlers that stopped early or not at all
+        for obj in gazetteobjs:
+            obj.checkpoint()
+
+    if pending:
+        # threads stuck in a fetch cannot be interrupted and would also
+        # hold up the interpreter exit, so leave right away
+        logger.warning('Crawlers did not exit in %d secs. Exiting', \
+                       grace_secs)
+        logging.shutdown()
+        os._exit(1)
+
+    newdownloads = []
+    for task in tasks:
+        newdownloads.extend(task.result())
+    return newdownloads
+
+def parallel_download(gazetteobjs, fromdate, todate, max_wait, all_dls, \
+                      max_per_host, day_workers = 1, adaptive = False, \
+                      grace_secs = 60):
+    event = threading.Event()
+    return asyncio.run(crawl(gazetteobjs, fromdate, todate, max_wait, \
+                             all_dls, max_per_host, day_workers, adaptive, \
+                             grace_secs, event))
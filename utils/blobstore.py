@@ -0,0 +1,80 @@
+import os
+import filecmp
+import logging
+import hashlib
+import threading
+
+# Raw documents stored once by their sha256 under blobs/, the files in
+# raw/ being hardlinks to them. The same gazette fetched under several
+# relurls then takes the disk space of one copy.
+
+def get_file_hash(filepath):
+    sha256 = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+class BlobStore:
+    def __init__(self, dirpath):
+        self.dirpath = dirpath
+        self.logger  = logging.getLogger('judis.blobstore')
+
+    def get_blob_path(self, sha256):
+        return os.path.join(self.dirpath, sha256[:2], sha256[2:4], sha256)
+
+    def is_linked(self, filepath, sha256):
+        blobpath = self.get_blob_path(sha256)
+        try:
+            return os.path.samefile(filepath, blobpath)
+        except OSError:
+            return False
+
+    def add(self, filepath, sha256):
+        # returns True if filepath now shares the blob of an earlier copy
+        blobpath = self.get_blob_path(sha256)
+        os.makedirs(os.path.dirname(blobpath), exist_ok = True)
+
+        try:
+            os.link(filepath, blobpath)
+            return False
+        except FileExistsError:
+            pass
+        except OSError as e:
+            self.logger.warning('Could not add %s to the blob store: %s', \
+                                filepath, e)
+            return False
+
+        if os.path.samefile(filepath, blobpath):
+            return False
+
+        # a blob corrupted on disk or a file changed since it was hashed
+        # must not take the place of the other
+        if not filecmp.cmp(filepath, blobpath, shallow = False):
+            self.logger.warning('Blob %s does not match %s, leaving it alone', \
+                                sha256, filepath)
+            return False
+
+        # swap the copy for a link, the rename keeps the file in place for
+        # readers all along
+        dirname, filename = os.path.split(filepath)
+        tmppath = os.path.join(dirname, '.%s.link-%d-%d' % \
+                               (filename, os.getpid(), threading.get_ident()))
+        try:
+            os.link(blobpath, tmppath)
+            os.replace(tmppath, filepath)
+        except OSError as e:
+            self.logger.warning('Could not link %s to blob %s: %s', \
+                                filepath, sha256, e)
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            return False
+        return True
+
+    def find_orphans(self):
+        # blobs that no raw file links to any more
+        for dirpath, dirnames, filenames in os.walk(self.dirpath):
+            for filename in filenames:
+                blobpath = os.path.join(dirpath, filename)
+                if os.stat(blobpath).st_nlink == 1:
+                    yield blobpath
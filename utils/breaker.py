@@ -0,0 +1,81 @@
+import os
+import time
+import threading
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+class CircuitOpen(Exception):
+    def __init__(self, hostname):
+        Exception.__init__(self, 'circuit open for %s' % hostname)
+        self.hostname = hostname
+
+class CircuitBreaker:
+    def __init__(self, hostname, max_failures = 5, reset_secs = 300):
+        self.hostname     = hostname
+        self.max_failures = max_failures
+        self.reset_secs   = reset_secs
+
+        self.state     = CLOSED
+        self.failures  = 0
+        self.opened_at = None
+        self.probing   = False
+        self.lock      = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+
+            if self.state == OPEN and \
+                    time.time() - self.opened_at >= self.reset_secs:
+                # let a single probe through to see if the host is back
+                self.state   = HALF_OPEN
+                self.probing = True
+                return True
+
+            return False
+
+    def is_open(self):
+        with self.lock:
+            return self.state == OPEN
+
+    def is_half_open(self):
+        with self.lock:
+            return self.state == HALF_OPEN
+
+    def record_success(self):
+        with self.lock:
+            self.state    = CLOSED
+            self.failures = 0
+            self.probing  = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.max_failures:
+                self.state     = OPEN
+                self.opened_at = time.time()
+                self.probing   = False
+
+class BreakerRegistry:
+    def __init__(self):
+        self.breakers = {}
+        self.lock     = threading.Lock()
+        self.pid      = os.getpid()
+
+    def get_breaker(self, hostname, max_failures, reset_secs):
+        with self.lock:
+            # every crawler process tracks the health of its hosts afresh
+            if self.pid != os.getpid():
+                self.breakers = {}
+                self.pid      = os.getpid()
+
+            if hostname not in self.breakers:
+                self.breakers[hostname] = \
+                        CircuitBreaker(hostname, max_failures, reset_secs)
+            return self.breakers[hostname]
+
+registry = BreakerRegistry()
+
+def get_breaker(hostname, max_failures = 5, reset_secs = 300):
+    return registry.get_breaker(hostname, max_failures, reset_secs)
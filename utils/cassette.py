@@ -0,0 +1,193 @@
+import os
+import io
+import gzip
+import json
+import hashlib
+import logging
+import threading
+from http.client import HTTPMessage
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+from urllib3._collections import HTTPHeaderDict
+
+# Request/response pairs recorded from the live sites so that the crawlers
+# can be run again without the network. A cassette is a directory with
+# one requests-<pid>.jsonl file per recording process and the bodies,
+# gzipped and named by their sha256, under bodies/.
+
+RECORD, REPLAY = 'record', 'replay'
+
+# the recorded bodies are already decoded
+DROP_HEADERS = set(['content-encoding', 'transfer-encoding', 'content-length'])
+
+def get_body_hash(body):
+    if body == None:
+        return None
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if not isinstance(body, bytes):
+        return None
+    return hashlib.sha256(body).hexdigest()
+
+class Cassette:
+    def __init__(self, dirpath):
+        self.dirpath  = dirpath
+        self.bodydir  = os.path.join(dirpath, 'bodies')
+        self.lock     = threading.Lock()
+        self.logger   = logging.getLogger('crawler.cassette')
+
+        self.entries  = None
+        self.fallback = None
+        self.served   = {}
+
+    def get_body_path(self, sha256):
+        return os.path.join(self.bodydir, '%s.gz' % sha256)
+
+    def save_body(self, content):
+        sha256 = hashlib.sha256(content).hexdigest()
+        filepath = self.get_body_path(sha256)
+        if not os.path.exists(filepath):
+            os.makedirs(self.bodydir, exist_ok = True)
+            tmppath = '%s.%d.tmp' % (filepath, os.getpid())
+            with gzip.open(tmppath, 'wb') as f:
+                f.write(content)
+            os.replace(tmppath, filepath)
+        return sha256
+
+    def load_body(self, sha256):
+        with gzip.open(self.get_body_path(sha256), 'rb') as f:
+            return f.read()
+
+    def record(self, request, response):
+        headers = []
+        original = getattr(response.raw, '_original_response', None)
+        if original != None:
+            items = original.msg.items()
+        else:
+            items = response.headers.items()
+        for k, v in items:
+            if k.lower() not in DROP_HEADERS:
+                headers.append([k, v])
+
+        entry = {'method': request.method, 'url': request.url, \
+                 'body': get_body_hash(request.body), \
+                 'status': response.status_code, 'reason': response.reason, \
+                 'headers': headers, \
+                 'content': self.save_body(response.content)}
+
+        filepath = os.path.join(self.dirpath, 'requests-%d.jsonl' % os.getpid())
+        line = json.dumps(entry) + '\n'
+        with self.lock:
+            with open(filepath, 'a') as f:
+                f.write(line)
+
+    def load(self):
+        self.entries  = {}
+        self.fallback = {}
+        if not os.path.isdir(self.dirpath):
+            return
+
+        for filename in sorted(os.listdir(self.dirpath)):
+            if not filename.endswith('.jsonl'):
+                continue
+            with open(os.path.join(self.dirpath, filename), 'r') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    key = (entry['method'], entry['url'])
+                    self.entries.setdefault(key + (entry['body'],), []).append(entry)
+                    self.fallback.setdefault(key, []).append(entry)
+
+    def next_entry(self, key, entries):
+        # repeated requests get the recorded responses in order, the last
+        # one is served again once they run out
+        idx = self.served.get(key, 0)
+        self.served[key] = idx + 1
+        return entries[min(idx, len(entries) - 1)]
+
+    def lookup(self, request):
+        key = (request.method, request.url)
+        with self.lock:
+            if self.entries == None:
+                self.load()
+
+            exact = key + (get_body_hash(request.body),)
+            if exact in self.entries:
+                return self.next_entry(exact, self.entries[exact])
+
+            # bodies with random session ids or timestamps (DWR) do not
+            # match, fall back to the order in which the url was requested
+            if key in self.fallback:
+                return self.next_entry(key, self.fallback[key])
+        return None
+
+class RecordedResponse:
+    # stands in for the http.client response, the cookie jar reads the
+    # Set-Cookie headers off its msg
+    def __init__(self, msg):
+        self.msg = msg
+
+    def isclosed(self):
+        return True
+
+    def close(self):
+        pass
+
+class RecordAdapter(HTTPAdapter):
+    def __init__(self, cassette, *args, **kwargs):
+        HTTPAdapter.__init__(self, *args, **kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        response = HTTPAdapter.send(self, request, **kwargs)
+        try:
+            self.cassette.record(request, response)
+        except (OSError, requests.RequestException) as e:
+            self.cassette.logger.warning('Unable to record %s: %s', request.url, e)
+        return response
+
+class ReplayAdapter(HTTPAdapter):
+    def __init__(self, cassette, *args, **kwargs):
+        HTTPAdapter.__init__(self, *args, **kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        entry = self.cassette.lookup(request)
+        if entry == None:
+            raise requests.ConnectionError('No recorded response for %s %s' % \
+                                           (request.method, request.url), \
+                                           request = request)
+
+        msg = HTTPMessage()
+        headers = HTTPHeaderDict()
+        for k, v in entry['headers']:
+            msg[k] = v
+            headers.add(k, v)
+
+        content = self.cassette.load_body(entry['content'])
+        headers['Content-Length'] = '%d' % len(content)
+
+        original = RecordedResponse(msg)
+        resp = HTTPResponse(body = io.BytesIO(content), headers = headers, \
+                            status = entry['status'], reason = entry['reason'], \
+                            preload_content = False, decode_content = False, \
+                            original_response = original, \
+                            request_method = request.method, \
+                            request_url = request.url)
+        return self.build_response(request, resp)
+
+mode     = None
+cassette = None
+
+def setup(newmode, dirpath):
+    global mode, cassette
+    mode     = newmode
+    cassette = Cassette(dirpath)
+
+def get_adapter(*args, **kwargs):
+    if mode == RECORD:
+        return RecordAdapter(cassette, *args, **kwargs)
+    elif mode == REPLAY:
+        return ReplayAdapter(cassette, *args, **kwargs)
+    return HTTPAdapter(*args, **kwargs)
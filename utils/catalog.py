@@ -0,0 +1,199 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+
+# An index of the documents in a data directory, so that checking whether a
+# gazette is already there or finding the ones changed since a date does
+# not have to glob and stat the raw/ and metatags/ trees. The catalog is
+# built from the disk once and kept up to date by the FileManager.
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS docs (
+           relurl     TEXT PRIMARY KEY,
+           srcname    TEXT NOT NULL,
+           rawext     TEXT,
+           size       INTEGER,
+           sha256     TEXT,
+           raw_mtime  REAL,
+           meta_mtime REAL,
+           modified   REAL
+       )''',
+    'CREATE INDEX IF NOT EXISTS docs_modified ON docs (srcname, modified)',
+    'CREATE INDEX IF NOT EXISTS docs_sha256 ON docs (sha256)',
+    'CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)'
+]
+
+UPSERT_RAW = '''INSERT INTO docs (relurl, srcname, rawext, size, sha256, raw_mtime, modified)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (relurl) DO UPDATE SET
+                    rawext    = excluded.rawext,
+                    size      = excluded.size,
+                    sha256    = excluded.sha256,
+                    raw_mtime = excluded.raw_mtime,
+                    modified  = MAX(excluded.raw_mtime, COALESCE(meta_mtime, 0))'''
+
+UPSERT_META = '''INSERT INTO docs (relurl, srcname, meta_mtime, modified)
+                 VALUES (?, ?, ?, ?)
+                 ON CONFLICT (relurl) DO UPDATE SET
+                     meta_mtime = excluded.meta_mtime,
+                     modified   = MAX(excluded.meta_mtime, COALESCE(raw_mtime, 0))'''
+
+def get_srcname(relurl):
+    return relurl.split('/')[0]
+
+class Catalog:
+    def __init__(self, dbpath):
+        self.dbpath = dbpath
+        self.local  = threading.local()
+        self.logger = logging.getLogger('judis.catalog')
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local = threading.local()
+
+    def get_conn(self):
+        # sqlite connections are neither shared across threads nor
+        # survive a fork
+        pid = os.getpid()
+        if getattr(self.local, 'pid', None) != pid:
+            conn = sqlite3.connect(self.dbpath, timeout = 300, \
+                                   isolation_level = None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            for stmt in SCHEMA:
+                conn.execute(stmt)
+            self.local.conn = conn
+            self.local.pid  = pid
+        return self.local.conn
+
+    def is_built(self):
+        if not os.path.exists(self.dbpath):
+            return False
+        row = self.get_conn().execute('SELECT value FROM info WHERE key = ?', \
+                                      ('built',)).fetchone()
+        return row != None
+
+    def build(self, rawdocs, metadocs, force = False):
+        conn = self.get_conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # another process may have built it while this one waited
+            if not force and self.is_built():
+                conn.execute('COMMIT')
+                return False
+
+            conn.execute('DELETE FROM docs')
+            conn.executemany(UPSERT_RAW, \
+                ((relurl, get_srcname(relurl), ext, size, None, mtime, mtime) \
+                 for relurl, ext, size, mtime in rawdocs))
+            conn.executemany(UPSERT_META, \
+                ((relurl, get_srcname(relurl), mtime, mtime) \
+                 for relurl, mtime in metadocs))
+            conn.execute('INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)', \
+                         ('built', '%f' % time.time()))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return True
+
+    def add_raw(self, relurl, ext, size, sha256, mtime):
+        self.get_conn().execute(UPSERT_RAW, (relurl, get_srcname(relurl), \
+                                             ext, size, sha256, mtime, mtime))
+
+    def add_meta(self, relurl, mtime):
+        self.get_conn().execute(UPSERT_META, (relurl, get_srcname(relurl), \
+                                              mtime, mtime))
+
+    def remove_raw(self, relurl):
+        self.get_conn().execute('''UPDATE docs SET rawext = NULL, size = NULL, sha256 = NULL,
+                                       raw_mtime = NULL WHERE relurl = ?''', (relurl,))
+
+    def remove_meta(self, relurl):
+        self.get_conn().execute('UPDATE docs SET meta_mtime = NULL WHERE relurl = ?', \
+                                (relurl,))
+
+    def set_sha256(self, relurl, sha256):
+        self.get_conn().execute('UPDATE docs SET sha256 = ? WHERE relurl = ?', \
+                                (sha256, relurl))
+
+    def find_by_sha256(self, sha256):
+        rows = self.get_conn().execute('SELECT relurl FROM docs WHERE sha256 = ? ORDER BY relurl', \
+                                       (sha256,))
+        return [row[0] for row in rows]
+
+    def get_rawdocs(self, srcnames):
+        query = 'SELECT relurl, rawext, size, sha256 FROM docs WHERE rawext IS NOT NULL'
+        if srcnames:
+            query += ' AND srcname IN (%s)' % ', '.join('?' * len(srcnames))
+        query += ' ORDER BY relurl'
+        return self.get_conn().execute(query, list(srcnames)).fetchall()
+
+    def get_duplicate_groups(self):
+        query = '''SELECT sha256, COUNT(*), MAX(size), GROUP_CONCAT(DISTINCT srcname)
+                   FROM docs WHERE sha256 IS NOT NULL AND rawext IS NOT NULL
+                   GROUP BY sha256 HAVING COUNT(*) > 1 ORDER BY COUNT(*) DESC'''
+        return self.get_conn().execute(query).fetchall()
+
+    def get_raw_ext(self, relurl):
+        row = self.get_conn().execute('SELECT rawext FROM docs WHERE relurl = ?', \
+                                      (relurl,)).fetchone()
+        if row == None:
+            return None
+        return row[0]
+
+    def has_meta(self, relurl):
+        row = self.get_conn().execute('SELECT meta_mtime FROM docs WHERE relurl = ?', \
+                                      (relurl,)).fetchone()
+        return row != None and row[0] != None
+
+    def get_docinfo(self, relurl):
+        cursor = self.get_conn().execute('SELECT * FROM docs WHERE relurl = ?', \
+                                         (relurl,))
+        row = cursor.fetchone()
+        if row == None:
+            return None
+        return dict(zip([c[0] for c in cursor.description], row))
+
+    def get_srcnames(self):
+        rows = self.get_conn().execute('SELECT DISTINCT srcname FROM docs ORDER BY srcname')
+        return [row[0] for row in rows]
+
+    def find_relurls(self, srcnames, start_ts, end_ts):
+        # documents with both the raw file and the metadata, of which at
+        # least one changed within the window
+        query  = 'SELECT relurl FROM docs WHERE srcname = ? AND rawext IS NOT NULL AND meta_mtime IS NOT NULL'
+        params = []
+        if start_ts != None:
+            query += ' AND modified >= ?'
+            params.append(start_ts)
+        if end_ts != None:
+            query += ' AND MIN(raw_mtime, meta_mtime) <= ?'
+            params.append(end_ts)
+        query += ' ORDER BY relurl'
+
+        if not srcnames:
+            srcnames = self.get_srcnames()
+
+        for srcname in sorted(srcnames):
+            for row in self.get_conn().execute(query, [srcname] + params):
+                yield row[0]
+
+    def find_docinfos(self, srcname, start_ts):
+        # documents with metadata that changed since start_ts, the raw
+        # file may not be there
+        query  = 'SELECT relurl, size, sha256 FROM docs WHERE srcname = ? AND meta_mtime IS NOT NULL'
+        params = [srcname]
+        if start_ts != None:
+            query += ' AND modified >= ?'
+            params.append(start_ts)
+
+        for row in self.get_conn().execute(query, params):
+            yield {'relurl': row[0], 'size': row[1], 'sha256': row[2]}
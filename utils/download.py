@@ -1,28 +1,58 @@
 import multiprocessing
-import urllib.request, urllib.error, urllib.parse
 import time
 import logging
 import re
+import os
+import signal
 
-from . import proxylist
+from .throttle import HostSlots, AdaptiveLimiter
 
-def sync(hostname, gazetteobjs, fromdate, todate, event):
-    if hostname in proxylist.hostdict:
-        proxy = urllib.request.ProxyHandler(proxylist.hostdict[hostname])
-        opener = urllib.request.build_opener(proxy)
-        urllib.request.install_opener(opener)
+def install_checkpoint(gazetteobjs):
+    # the controller terminates crawlers that overrun the deadline, record
+    # the days they did not get to so that the next run retries them
+    def checkpoint(signum, frame):
+        logger = logging.getLogger('crawler.controller')
+        logger.warning('Terminated past the deadline, checkpointing')
+        for obj in gazetteobjs:
+            obj.checkpoint()
+        logging.shutdown()
+        os._exit(1)
+
+    signal.signal(signal.SIGTERM, checkpoint)
+
+def setup_workers(gazetteobjs, event, day_workers, max_per_host, limiter):
+    if limiter != None:
+        host_slots = limiter
+    else:
+        host_slots = HostSlots(max_per_host)
+
+    for obj in gazetteobjs:
+        obj.set_event(event)
+        obj.set_day_workers(day_workers)
+        obj.set_host_slots(host_slots)
+
+    install_checkpoint(gazetteobjs)
 
+def sync(hostname, gazetteobjs, fromdate, todate, event, \
+         day_workers = 1, max_per_host = 2, limiter = None):
+    # proxies from proxylist are applied by the pooled http sessions
+    setup_workers(gazetteobjs, event, day_workers, max_per_host, limiter)
     for obj in gazetteobjs:
         if fromdate == None and todate == None:
             obj.sync_daily(event)
         else:    
             obj.sync(fromdate, todate, event)
+        obj.drain_retries(event)
 
-def all_downloads(hostname, gazetteobjs, event):
+def all_downloads(hostname, gazetteobjs, event, \
+                  day_workers = 1, max_per_host = 2, limiter = None):
+    setup_workers(gazetteobjs, event, day_workers, max_per_host, limiter)
     for obj in gazetteobjs:
         obj.all_downloads(event)
+        obj.drain_retries(event)
 
-def agg_host_processes(gazetteobjs, all_dls, fromdate, todate, event):
+def agg_host_processes(gazetteobjs, all_dls, fromdate, todate, event, \
+                       day_workers, max_per_host, limiter):
     srcdict = {}
     for src in gazetteobjs:
         hostname = src.hostname
@@ -33,34 +63,56 @@ def agg_host_processes(gazetteobjs, all_dls, fromdate, todate, event):
     tlist = []
     for hostname, srclist in srcdict.items():
         if all_dls:
-            t = multiprocessing.Process(target = all_downloads, args = (hostname, srclist, event))
+            t = multiprocessing.Process(target = all_downloads, args = \
+                    (hostname, srclist, event, day_workers, max_per_host, limiter))
         else:
             t = multiprocessing.Process(target = sync, args = \
-                                (hostname, srclist, fromdate, todate, event))
+                                (hostname, srclist, fromdate, todate, event, \
+                                 day_workers, max_per_host, limiter))
         t.start()
         tlist.append(t)
 
     return tlist
 
-def noagg_host_processes(gazetteobjs, all_dls, fromdate, todate, event):
+def noagg_host_processes(gazetteobjs, all_dls, fromdate, todate, event, \
+                         day_workers, max_per_host, limiter):
     tlist = []
     for src in gazetteobjs:
         if all_dls:
-            t = multiprocessing.Process(target = all_downloads, args = (src.hostname, [src], event))
+            t = multiprocessing.Process(target = all_downloads, args = \
+                    (src.hostname, [src], event, day_workers, max_per_host, limiter))
         else:
             t = multiprocessing.Process(target = sync, args = \
-                                (src.hostname, [src], fromdate, todate, event))
+                                (src.hostname, [src], fromdate, todate, event, \
+                                 day_workers, max_per_host, limiter))
         t.start()
         tlist.append(t)
 
     return tlist
 
-def parallel_download(gazetteobjs, agghosts, fromdate, todate, max_wait, all_dls):
+def join_until(tlist, deadline):
+    for t in tlist:
+        timeout = deadline - time.time()
+        if timeout <= 0:
+            break
+        t.join(timeout)
+
+def parallel_download(gazetteobjs, agghosts, fromdate, todate, max_wait, all_dls, \
+                      day_workers = 1, max_per_host = 2, adaptive = False, \
+                      grace_secs = 60):
     event = multiprocessing.Event()
+
+    limiter = None
+    if adaptive:
+        hostnames = [obj.hostname for obj in gazetteobjs]
+        limiter   = AdaptiveLimiter(hostnames, max_per_host)
+
     if agghosts:
-        tlist = agg_host_processes(gazetteobjs, all_dls, fromdate, todate, event)
+        tlist = agg_host_processes(gazetteobjs, all_dls, fromdate, todate, event, \
+                                   day_workers, max_per_host, limiter)
     else:
-        tlist = noagg_host_processes(gazetteobjs, all_dls, fromdate, todate, event)
+        tlist = noagg_host_processes(gazetteobjs, all_dls, fromdate, todate, event, \
+                                     day_workers, max_per_host, limiter)
 
     start_ts = time.time()
     for t in tlist:
@@ -78,8 +130,18 @@ def parallel_download(gazetteobjs, agghosts, fromdate, todate, max_wait, all_dls
         logger = logging.getLogger('crawler.controller')
         logger.warning('Time expired. Setting the event and asking the crawlers to exit')
         event.set()
-        for t in tlist:
+        join_until(tlist, time.time() + grace_secs)
+
+        alive = [t for t in tlist if t.is_alive()]
+        for t in alive:
+            logger.warning('Crawler %s did not exit in %d secs. Terminating it', \
+                           t.name, grace_secs)
+            t.terminate()
+
+        join_until(alive, time.time() + 10)
+        for t in alive:
             if t.is_alive():
+                t.kill()
                 t.join()
 
   
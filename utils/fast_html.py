@@ -0,0 +1,132 @@
+import io
+
+from lxml import etree
+from lxml import html as lxml_html
+
+# A thin BeautifulSoup look-alike over lxml trees. Tags answer to .name,
+# .get, .find and .find_all the way the srcs use them, and
+# utils.get_tag_contents accepts them, so row parsing code runs unchanged
+# on either parser.
+
+def matches(element, name, attrs):
+    if not isinstance(element.tag, str):
+        return False
+
+    if name != None:
+        if hasattr(name, 'search'):
+            if not name.search(element.tag):
+                return False
+        elif isinstance(name, (list, tuple, set)):
+            if element.tag not in name:
+                return False
+        elif element.tag != name:
+            return False
+
+    for k, v in attrs.items():
+        value = element.get(k)
+        if k == 'class' and value != None and v in value.split():
+            continue
+        if value != v:
+            return False
+    return True
+
+class Tag:
+    def __init__(self, element):
+        self.element = element
+        self.name    = element.tag
+
+    def get(self, attr, default = None):
+        value = self.element.get(attr, default)
+        if attr == 'class' and value != None and value != default:
+            return value.split()
+        return value
+
+    def find_all(self, name = None, attrs = {}, recursive = True):
+        if recursive:
+            elements = self.element.iterdescendants()
+        else:
+            elements = self.element.iterchildren()
+
+        tags = []
+        for element in elements:
+            if matches(element, name, attrs):
+                tags.append(Tag(element))
+        return tags
+
+    def find(self, name = None, attrs = {}):
+        for element in self.element.iterdescendants():
+            if matches(element, name, attrs):
+                return Tag(element)
+        return None
+
+    def get_contents(self):
+        return get_contents(self.element)
+
+    def __repr__(self):
+        return etree.tostring(self.element, encoding = 'unicode', \
+                              with_tail = False)
+
+def get_contents(element):
+    # same text as utils.get_tag_contents gives for a BeautifulSoup tag
+    retval = []
+    if element.text:
+        retval.append(element.text)
+
+    for child in element:
+        if isinstance(child.tag, str) and child.tag not in ['style', 'script']:
+            if child.tag not in ['span']:
+                retval.append(' ')
+            retval.append(get_contents(child))
+        if child.tail:
+            retval.append(child.tail)
+    return ''.join(retval)
+
+def get_encoding(webpage):
+    # lxml falls back to latin-1 for pages that do not declare a charset
+    try:
+        webpage.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    return 'utf-8'
+
+def parse_webpage(webpage):
+    if isinstance(webpage, bytes):
+        parser = lxml_html.HTMLParser(encoding = get_encoding(webpage))
+    else:
+        parser = None
+
+    try:
+        root = lxml_html.document_fromstring(webpage, parser = parser)
+    except (etree.ParserError, ValueError):
+        return None
+    return Tag(root)
+
+def parse_tables(webpage, attrs = {}):
+    # only the tables matching attrs are kept, the others are dropped as
+    # soon as they are parsed
+    if not webpage:
+        return []
+
+    if isinstance(webpage, str):
+        webpage = webpage.encode('utf-8')
+
+    tables = []
+    try:
+        for event, element in etree.iterparse(io.BytesIO(webpage), \
+                                              events = ('end',), tag = 'table', \
+                                              html = True, recover = True, \
+                                              encoding = get_encoding(webpage)):
+            if matches(element, 'table', attrs):
+                tables.append(Tag(element))
+                continue
+
+            keep = False
+            for ancestor in element.iterancestors('table'):
+                if matches(ancestor, 'table', attrs):
+                    keep = True
+                    break
+            if not keep:
+                element.clear(keep_tail = True)
+    except etree.LxmlError:
+        return tables
+    return tables
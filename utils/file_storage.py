@@ -1,22 +1,33 @@
 import os
-import logging
 import glob
+import logging
 import time
+import json
+import hashlib
+import threading
 
 from . import utils
 from . import xml_ops
+from .catalog import Catalog
+from .journal import Journal
+from .blobstore import BlobStore, get_file_hash
+
+# bytes of a streamed document that are used to sniff its type
+HEAD_SIZE = 8192
 
 def mk_dir(dirname):
-    if not os.path.exists(dirname):
-        os.mkdir(dirname)
+    # crawler threads may race to create the same day directory
+    os.makedirs(dirname, exist_ok = True)
 
 
 class FileManager:
-    def __init__(self, basedir, updateMeta, updateRaw):
+    def __init__(self, basedir, updateMeta, updateRaw, dedup = False, \
+                 journal = False):
         self.logger = logging.getLogger('judis.filemanager')
 
         self.rawdir = os.path.join(basedir, 'raw')
         self.metadir = os.path.join(basedir, 'metatags')
+        self.ledgerdir = os.path.join(basedir, 'ledger')
 
         self.updateRaw  = updateRaw
         self.updateMeta = updateMeta
@@ -24,6 +35,61 @@ class FileManager:
         mk_dir(self.rawdir)
         mk_dir(self.metadir)
 
+        self.blobstore = None
+        if dedup:
+            self.blobstore = BlobStore(os.path.join(basedir, 'blobs'))
+
+        # an append takes a file lock and an fsync, only paid for when a
+        # consumer like iasync -j reads the journal
+        self.journal = None
+        if journal:
+            self.journal = Journal(os.path.join(basedir, 'journal'))
+        # built by tools/rebuild_catalog.py, kept up to date by the saves
+        # either way
+        self.catalog = Catalog(os.path.join(basedir, 'catalog.sqlite'))
+
+    def scan_docs(self, dirname, relurl):
+        with os.scandir(os.path.join(dirname, relurl)) as entries:
+            entries = sorted(entries, key = lambda e: e.name)
+
+        for entry in entries:
+            # partial and temporary downloads
+            if entry.name.startswith('.'):
+                continue
+            tmprel = os.path.join(relurl, entry.name)
+            if entry.is_dir():
+                for doc in self.scan_docs(dirname, tmprel):
+                    yield doc
+            elif entry.is_file():
+                stat = entry.stat()
+                yield tmprel, stat.st_size, stat.st_mtime
+
+    def split_ext(self, relpath):
+        # the extension is of the file name alone, and a raw document
+        # saved without one has the empty extension
+        dirname, filename = os.path.split(relpath)
+        name, dot, ext = filename.rpartition('.')
+        if not name:
+            return relpath, ''
+        return os.path.join(dirname, name), ext
+
+    def scan_rawdocs(self):
+        for relurl, size, mtime in self.scan_docs(self.rawdir, ''):
+            relurl, ext = self.split_ext(relurl)
+            yield relurl, ext, size, mtime
+
+    def scan_metadocs(self):
+        for relurl, size, mtime in self.scan_docs(self.metadir, ''):
+            if relurl.endswith('.xml'):
+                yield relurl[:-4], mtime
+
+    def rebuild_catalog(self, force = True):
+        self.logger.info('Building the document catalog from %s', self.rawdir)
+        start = time.time()
+        if self.catalog.build(self.scan_rawdocs(), self.scan_metadocs(), force):
+            self.logger.info('Built the document catalog in %.1f secs', \
+                             time.time() - start)
+
     def create_dirs(self, dirname, relurl):
         words = relurl.split('/')
         for word in words[:-1]: 
@@ -36,19 +102,71 @@ class FileManager:
             return xml_ops.read_tag_file(metapath, relurl)
 
         return None   
+
+    def get_metainfos(self, relurls):
+        # like get_metainfo for each relurl, the files are read together
+        items = []
+        for relurl in relurls:
+            metapath = os.path.join(self.metadir, '%s.xml' % relurl)
+            if os.path.exists(metapath):
+                items.append((metapath, relurl))
+
+        metainfos = dict(zip([relurl for metapath, relurl in items], \
+                             xml_ops.read_tag_files(items)))
+        return [metainfos.get(relurl) for relurl in relurls]
          
     def get_rawfile_path(self, relurl):
-        rawpath  = os.path.join(self.rawdir, relurl)
-        rawpaths = glob.glob('%s.*' % rawpath)
-        if rawpaths:
-            return rawpaths[0]
+        rawpath = os.path.join(self.rawdir, relurl)
+        ext = self.catalog.get_raw_ext(relurl)
+        if ext == None:
+            return self.find_rawfile(relurl)
 
-        return None    
+        if ext != '':
+            rawpath = '%s.%s' % (rawpath, ext)
+        if os.path.exists(rawpath):
+            return rawpath
+
+        # removed since it was catalogued
+        self.catalog.remove_raw(relurl)
+        return self.find_rawfile(relurl)
+
+    def find_rawfile(self, relurl):
+        # documents written to raw/ by tools that do not go through the
+        # catalog, catalogued once found
+        rawpath   = os.path.join(self.rawdir, relurl)
+        filepaths = sorted(glob.glob('%s.*' % glob.escape(rawpath))) + [rawpath]
+        for filepath in filepaths:
+            if not os.path.isfile(filepath):
+                continue
+            if filepath == rawpath:
+                ext = ''
+            else:
+                name, ext = self.split_ext(filepath)
+                if name != rawpath:
+                    continue
+
+            stat = os.stat(filepath)
+            self.catalog.add_raw(relurl, ext, stat.st_size, None, stat.st_mtime)
+            return filepath
+        return None
+
+    def has_rawdoc(self, relurl):
+        return self.get_rawfile_path(relurl) != None
+
+    def get_ledger_path(self, srcname):
+        mk_dir(self.ledgerdir)
+        return os.path.join(self.ledgerdir, '%s.json' % srcname)
 
     def get_metafile_path(self, relurl):
         metapath = os.path.join(self.metadir, '%s.xml' % relurl)
+        catalogued = self.catalog.has_meta(relurl)
         if os.path.exists(metapath):
+            if not catalogued:
+                self.catalog.add_meta(relurl, os.path.getmtime(metapath))
             return metapath
+
+        if catalogued:
+            self.catalog.remove_meta(relurl)
         return None    
 
     def save_metainfo(self, court, relurl, metainfo):
@@ -58,6 +176,9 @@ class FileManager:
 
         if metainfo and (self.updateMeta or not os.path.exists(metapath)):
             xml_ops.print_tag_file(metapath, metainfo)
+            self.catalog.add_meta(relurl, os.path.getmtime(metapath))
+            if self.journal != None:
+                self.journal.append(relurl, 'meta')
             return True
         return False 
 
@@ -65,13 +186,48 @@ class FileManager:
         return None, None
         
     def save_binary_file(self, filepath, buf):
-        h = open(filepath, 'wb')
+        # written aside and renamed, an older copy may be a hardlink into
+        # the blob store and must not be overwritten in place
+        tmppath = self.get_tmp_path(filepath, 'tmp-%d-%d' % \
+                                    (os.getpid(), threading.get_ident()))
+        h = open(tmppath, 'wb')
         h.write(buf)
         h.close()
+        os.replace(tmppath, filepath)
+
+    def link_blob(self, relurl, filepath, sha256):
+        if self.blobstore != None and \
+                self.blobstore.add(filepath, sha256):
+            self.logger.info('Linked %s to an identical copy', relurl)
+
+    def get_duplicates(self, relurl):
+        # other relurls with byte identical raw documents
+        docinfo = self.catalog.get_docinfo(relurl)
+        if docinfo == None or docinfo['sha256'] == None:
+            return []
+        relurls = self.catalog.find_by_sha256(docinfo['sha256'])
+        return [r for r in relurls if r != relurl]
+
+    def fill_hashes(self, srcnames):
+        # documents catalogued from the disk have no hash yet, returns
+        # the relurls hashed now
+        hashed = []
+        for relurl, rawext, size, sha256 in self.catalog.get_rawdocs(srcnames):
+            if sha256 != None:
+                continue
+            rawpath = self.get_rawfile_path(relurl)
+            try:
+                self.catalog.set_sha256(relurl, get_file_hash(rawpath))
+            except (OSError, TypeError) as e:
+                self.logger.warning('Could not hash %s: %s', relurl, e)
+                continue
+            hashed.append(relurl)
+        if hashed:
+            self.logger.info('Hashed %d raw documents', len(hashed))
+        return hashed
 
     def should_download_raw(self, relurl, judge_url, validurl = True):
-        rawpath  = os.path.join(self.rawdir, relurl)
-        return self.updateRaw or not glob.glob('%s.*' % rawpath)
+        return self.updateRaw or not self.has_rawdoc(relurl)
 
     def get_file_extension(self, doc):
         mtype = utils.get_buffer_type(doc)
@@ -81,58 +237,172 @@ class FileManager:
         self.create_dirs(self.rawdir, relurl)
         rawpath  = os.path.join(self.rawdir, relurl)
 
-        if doc and (self.updateRaw or not glob.glob('%s.*' % rawpath)):
+        if doc and (self.updateRaw or not self.has_rawdoc(relurl)):
             extension = self.get_file_extension(doc)
-            self.save_binary_file('%s.%s' % (rawpath, extension), doc)
+            filepath  = '%s.%s' % (rawpath, extension)
+            sha256    = hashlib.sha256(doc).hexdigest()
+            self.save_binary_file(filepath, doc)
+            self.link_blob(relurl, filepath, sha256)
+            self.catalog.add_raw(relurl, extension, len(doc), sha256, \
+                                 os.path.getmtime(filepath))
+            if self.journal != None:
+                self.journal.append(relurl, 'raw')
             return True
         return False
         
 
+    def get_tmp_path(self, rawpath, suffix):
+        # hidden so that the catalog rebuild does not take it for the doc
+        dirname, filename = os.path.split(rawpath)
+        return os.path.join(dirname, '.%s.%s' % (filename, suffix))
+
+    def get_partial_path(self, relurl):
+        return self.get_tmp_path(os.path.join(self.rawdir, relurl), 'part')
+
+    def get_partial(self, relurl):
+        partpath = self.get_partial_path(relurl)
+        infopath = '%s.json' % partpath
+        if not os.path.exists(partpath) or not os.path.exists(infopath):
+            return 0, None
+
+        try:
+            with open(infopath, 'r') as f:
+                partinfo = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning('Bad partial info for %s: %s', relurl, e)
+            return 0, None
+
+        return os.path.getsize(partpath), partinfo
+
+    def discard_partial(self, relurl):
+        partpath = self.get_partial_path(relurl)
+        for filepath in [partpath, '%s.json' % partpath]:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+
+    def save_rawdoc_stream(self, court, relurl, chunks, is_valid = None, \
+                           partinfo = None, append = False):
+        self.create_dirs(self.rawdir, relurl)
+        rawpath  = os.path.join(self.rawdir, relurl)
+
+        if not self.updateRaw and self.has_rawdoc(relurl):
+            return None
+
+        # with partinfo the bytes received so far survive a failure and
+        # the download can be resumed, even by a later run
+        if partinfo != None:
+            tmppath = self.get_partial_path(relurl)
+            with open('%s.json' % tmppath, 'w') as f:
+                json.dump(partinfo, f)
+        else:
+            tmppath = self.get_tmp_path(rawpath, 'tmp-%d-%d' % \
+                                        (os.getpid(), threading.get_ident()))
+
+        sha256 = hashlib.sha256()
+        state  = {'size': 0, 'head': b''}
+
+        def update(chunk):
+            head = state['head']
+            if len(head) < HEAD_SIZE:
+                state['head'] = head + chunk[:HEAD_SIZE - len(head)]
+            sha256.update(chunk)
+            state['size'] += len(chunk)
+
+        mode = 'wb'
+        if append and os.path.exists(tmppath):
+            mode = 'ab'
+            with open(tmppath, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    update(chunk)
+
+        try:
+            with open(tmppath, mode) as f:
+                for chunk in chunks:
+                    update(chunk)
+                    f.write(chunk)
+
+            size, head = state['size'], state['head']
+            if size == 0 or (is_valid != None and not is_valid(head, size)):
+                os.remove(tmppath)
+                if partinfo != None:
+                    self.discard_partial(relurl)
+                return None
+
+            mtype     = utils.get_buffer_type(head)
+            extension = utils.get_file_extension(mtype)
+            filepath  = '%s.%s' % (rawpath, extension)
+            os.replace(tmppath, filepath)
+            self.link_blob(relurl, filepath, sha256.hexdigest())
+            self.catalog.add_raw(relurl, extension, size, sha256.hexdigest(), \
+                                 os.path.getmtime(filepath))
+            if self.journal != None:
+                self.journal.append(relurl, 'raw')
+            if partinfo != None:
+                self.discard_partial(relurl)
+        except BaseException:
+            if partinfo == None and os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+
+        return {'path': filepath, 'sha256': sha256.hexdigest(), \
+                'size': size, 'mimetype': mtype}
+
     def recursive_relurls(self, datadir, relurl):
         current_dir = os.path.join(datadir, relurl)
         if os.path.isfile(current_dir):
-            tmprel = relurl.rsplit('.', 1)[0]
+            tmprel = self.split_ext(relurl)[0]
             yield tmprel
 
         if os.path.isdir(current_dir):
             filenames = os.listdir(current_dir)
             filenames.sort()
             for filename in filenames:
+                # partial and temporary downloads
+                if filename.startswith('.'):
+                    continue
                 tmprel = os.path.join(relurl, filename)
                 for rel1 in self.recursive_relurls(datadir, tmprel):
                     yield rel1
                 
                     
     def find_matching_relurls(self, srcs, start_ts, end_ts):         
-        srcs = set(srcs)
-
         if start_ts:
             start_ts = time.mktime(start_ts.timetuple())
 
         if end_ts:
             end_ts = time.mktime(end_ts.timetuple())
 
-        srclist = os.listdir(self.rawdir)
-        srclist.sort()
+        # sources with nothing in the catalog are looked for on the disk,
+        # as are all of them until the catalog is built
+        catalogued = set()
+        if self.catalog.is_built():
+            catalogued = set(self.catalog.get_srcnames())
+        if srcs:
+            srclist = sorted(srcs)
+        else:
+            srclist = sorted(catalogued.union(os.listdir(self.rawdir)))
+
         for src in srclist:
-            if srcs and src not in srcs:
-                continue
-      
-            for relurl in self.recursive_relurls(self.rawdir, src):
-                rawpath   = self.get_rawfile_path(relurl)
-                metapath  = self.get_metafile_path(relurl)
+            if src in catalogued:
+                relurls = self.catalog.find_relurls([src], start_ts, end_ts)
+            else:
+                relurls = self.scan_matching_relurls(src, start_ts, end_ts)
+            for relurl in relurls:
+                yield relurl
 
-                if not os.path.isfile(rawpath):
-                    continue
+    def scan_matching_relurls(self, src, start_ts, end_ts):
+        for relurl in self.recursive_relurls(self.rawdir, src):
+            rawpath   = self.get_rawfile_path(relurl)
+            metapath  = self.get_metafile_path(relurl)
 
-                if not metapath or not os.path.isfile(metapath):
-                    continue
+            if not rawpath or not metapath:
+                continue
 
-                if start_ts != None and os.path.getmtime(rawpath) < start_ts \
-                        and  os.path.getmtime(metapath) < start_ts:
-                    continue 
+            if start_ts != None and os.path.getmtime(rawpath) < start_ts \
+                    and  os.path.getmtime(metapath) < start_ts:
+                continue 
 
-                if end_ts != None and os.path.getmtime(rawpath) > end_ts \
-                        and  os.path.getmtime(metapath) > end_ts:
-                    continue 
-                yield relurl    
+            if end_ts != None and os.path.getmtime(rawpath) > end_ts \
+                    and  os.path.getmtime(metapath) > end_ts:
+                continue 
+            yield relurl
@@ -0,0 +1,66 @@
+import threading
+from collections import OrderedDict
+
+from .fast_html import Tag, matches, parse_webpage
+
+# The ASP.NET portals post back the whole form several times for each day.
+# Pages are parsed once with lxml and the forms with their fields are
+# indexed, so that the srcs can keep calling find/find_all/get on them the
+# way they do with BeautifulSoup tags.
+
+class Form(Tag):
+    def __init__(self, element):
+        Tag.__init__(self, element)
+        self.found = {}
+
+    def find_all(self, name = None, attrs = {}):
+        # the same fields are asked for on every postback of a page
+        if isinstance(name, list):
+            name = tuple(name)
+        key = (getattr(name, 'pattern', name), tuple(sorted(attrs.items())))
+        if key not in self.found:
+            self.found[key] = Tag.find_all(self, name, attrs)
+        return self.found[key]
+
+class ParsedPage:
+    def __init__(self, root):
+        self.root  = root
+        self.forms = [Form(element) for element in root.iter('form')]
+
+    def find_all(self, name, attrs = {}):
+        if name == 'form':
+            return [form for form in self.forms if matches(form.element, None, attrs)]
+        return Tag(self.root).find_all(name, attrs)
+
+    def find(self, name, attrs = {}):
+        tags = self.find_all(name, attrs)
+        if tags:
+            return tags[0]
+        return None
+
+class PageCache(threading.local):
+    def __init__(self, max_pages = 4):
+        self.max_pages = max_pages
+        self.pages     = OrderedDict()
+
+    def get(self, webpage):
+        if webpage in self.pages:
+            self.pages.move_to_end(webpage)
+            return self.pages[webpage]
+
+        root = parse_webpage(webpage)
+        if root == None:
+            return None
+
+        page = ParsedPage(root.element)
+        self.pages[webpage] = page
+        if len(self.pages) > self.max_pages:
+            self.pages.popitem(last = False)
+        return page
+
+pages = PageCache()
+
+def parse_page(webpage):
+    if webpage == None:
+        return None
+    return pages.get(webpage)
@@ -0,0 +1,70 @@
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+
+from . import proxylist
+from . import cassette
+
+ACCEPT_ENCODING = 'gzip, deflate'
+
+class NoCookiePolicy(DefaultCookiePolicy):
+    # the pooled sessions are shared by every request to a host, cookies
+    # live in the CookieJar passed around by the crawlers instead
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+class SessionPool:
+    def __init__(self, pool_maxsize = 10):
+        self.pool_maxsize = pool_maxsize
+        self.sessions     = {}
+        self.lock         = threading.Lock()
+        self.pid          = os.getpid()
+
+    def new_session(self, hostname, max_retries):
+        s = requests.session()
+        s.cookies.set_policy(NoCookiePolicy())
+        s.headers['Accept-Encoding'] = ACCEPT_ENCODING
+
+        adapter = cassette.get_adapter(max_retries = max_retries, \
+                                       pool_connections = 4, \
+                                       pool_maxsize = self.pool_maxsize)
+        s.mount('http://', adapter)
+        s.mount('https://', adapter)
+
+        if hostname in proxylist.hostdict:
+            s.proxies.update(proxylist.hostdict[hostname])
+        return s
+
+    def get_session(self, hostname, kind = 'plain', max_retries = 0):
+        with self.lock:
+            # connections must not be shared with a forked parent
+            if self.pid != os.getpid():
+                self.sessions = {}
+                self.pid      = os.getpid()
+
+            key = (hostname, kind)
+            if key not in self.sessions:
+                self.sessions[key] = self.new_session(hostname, max_retries)
+            return self.sessions[key]
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+
+pool = SessionPool()
+
+def get_session(hostname, kind = 'plain', max_retries = 0):
+    return pool.get_session(hostname, kind, max_retries)
+
+def get_status_code(error):
+    response = getattr(error, 'response', None)
+    if response is not None:
+        return response.status_code
+    return None
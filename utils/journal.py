@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import fcntl
+import logging
+
+# A log of the documents saved to a data directory, so that the uploaders
+# pick up new work from where they left off instead of scanning for it.
+# Records are json lines appended to segment files named by the offset of
+# their first byte. Each consumer commits the offset it has processed up
+# to, and segments that all the consumers are past can be purged.
+#
+# Every append takes a file lock and an fsync, so the crawlers only
+# journal when asked to (sync.py -j). Without consumers nothing is purged,
+# so the number of segments is capped and the oldest ones are dropped on
+# rotation, except for those a consumer has not read to the end yet.
+
+SEGMENT_SIZE = 16 * 1024 * 1024
+MAX_SEGMENTS = 64
+
+class Journal:
+    def __init__(self, dirpath, segment_size = SEGMENT_SIZE, \
+                 max_segments = MAX_SEGMENTS):
+        self.dirpath      = dirpath
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.consumerdir  = os.path.join(dirpath, 'consumers')
+        self.lockpath     = os.path.join(dirpath, 'lock')
+        self.logger       = logging.getLogger('judis.journal')
+
+        os.makedirs(self.consumerdir, exist_ok = True)
+
+    def get_segment_path(self, base):
+        return os.path.join(self.dirpath, '%020d.log' % base)
+
+    def get_segments(self):
+        bases = []
+        for filename in os.listdir(self.dirpath):
+            if filename.endswith('.log'):
+                try:
+                    bases.append(int(filename[:-4]))
+                except ValueError:
+                    pass
+        bases.sort()
+        return bases
+
+    def append(self, relurl, kind):
+        record = {'relurl': relurl, 'kind': kind, 'ts': time.time()}
+        line = (json.dumps(record) + '\n').encode('utf-8')
+
+        # the crawler processes append to the same journal, the lock
+        # serializes the appends and the rotation
+        with open(self.lockpath, 'a') as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            try:
+                bases = self.get_segments()
+                if bases:
+                    base = bases[-1]
+                    size = os.path.getsize(self.get_segment_path(base))
+                    if size >= self.segment_size:
+                        base += size
+                        self.trim(bases)
+                else:
+                    base = 0
+
+                fd = os.open(self.get_segment_path(base), \
+                             os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    # a record cut short by a crash is not merged with this one
+                    end = os.lseek(fd, 0, os.SEEK_END)
+                    if end > 0 and os.pread(fd, 1, end - 1) != b'\n':
+                        line = b'\n' + line
+                    os.write(fd, line)
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+    def get_consumers(self):
+        return [f[:-5] for f in os.listdir(self.consumerdir) \
+                if f.endswith('.json')]
+
+    def trim(self, bases):
+        # called with the lock held, before the segment after bases[-1]
+        # is created
+        num = max(0, len(bases) + 1 - self.max_segments)
+        if num == 0:
+            return
+
+        offsets = dict((c, self.get_offset(c)) for c in self.get_consumers())
+        for base, nextbase in zip(bases[:num], bases[1:num + 1]):
+            behind = [c for c, offset in offsets.items() if offset < nextbase]
+            if behind:
+                self.logger.error('Journal is over the cap of %d segments, keeping segment %d unread by %s', \
+                                  self.max_segments, base, ', '.join(sorted(behind)))
+                return
+
+            self.logger.warning('Dropping journal segment %d, over the cap of %d segments', \
+                                base, self.max_segments)
+            os.remove(self.get_segment_path(base))
+
+    def read(self, offset):
+        # yields the records after offset with the offset just past each
+        # of them, a line still being written is left for the next read
+        bases = self.get_segments()
+        if bases and offset < bases[0]:
+            self.logger.warning('Journal records from %d to %d were dropped before they were read', \
+                                offset, bases[0])
+
+        for base in bases:
+            filepath = self.get_segment_path(base)
+            try:
+                size = os.path.getsize(filepath)
+            except OSError:
+                continue
+            if base + size <= offset:
+                continue
+
+            try:
+                f = open(filepath, 'rb')
+            except OSError:
+                # purged since the listing
+                continue
+            with f:
+                pos = max(0, offset - base)
+                f.seek(pos)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    pos += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        self.logger.warning('Bad journal record at %d in %s', \
+                                            pos, filepath)
+                        continue
+                    yield base + pos, record
+
+    def get_consumer_path(self, consumer):
+        return os.path.join(self.consumerdir, '%s.json' % consumer)
+
+    def get_offset(self, consumer):
+        filepath = self.get_consumer_path(consumer)
+        if not os.path.exists(filepath):
+            return 0
+
+        try:
+            with open(filepath, 'r') as f:
+                return json.load(f)['offset']
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.warning('Could not read the offset of %s: %s', consumer, e)
+            return 0
+
+    def commit(self, consumer, offset):
+        filepath = self.get_consumer_path(consumer)
+        tmppath  = '%s.%d.tmp' % (filepath, os.getpid())
+        with open(tmppath, 'w') as f:
+            json.dump({'offset': offset, 'ts': time.time()}, f)
+        os.replace(tmppath, filepath)
+
+    def purge(self):
+        consumers = self.get_consumers()
+        if not consumers:
+            return 0
+
+        offset = min(self.get_offset(c) for c in consumers)
+        bases  = self.get_segments()
+        purged = 0
+        # the last segment is kept as it tells where the next one starts
+        for base, nextbase in zip(bases, bases[1:]):
+            if nextbase <= offset:
+                os.remove(self.get_segment_path(base))
+                purged += 1
+        return purged
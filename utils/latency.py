@@ -0,0 +1,46 @@
+import os
+import threading
+from collections import deque
+
+LISTING, DOCUMENT = 'listing', 'document'
+
+class LatencyTracker:
+    def __init__(self, window = 200, min_samples = 20):
+        self.window      = window
+        self.min_samples = min_samples
+        self.samples     = {}
+        self.lock        = threading.Lock()
+        self.pid         = os.getpid()
+
+    def get_samples(self, hostname, reqclass):
+        # each crawler process learns the latencies of its hosts afresh
+        if self.pid != os.getpid():
+            self.samples = {}
+            self.pid     = os.getpid()
+
+        key = (hostname, reqclass)
+        if key not in self.samples:
+            self.samples[key] = deque(maxlen = self.window)
+        return self.samples[key]
+
+    def record(self, hostname, reqclass, secs):
+        with self.lock:
+            self.get_samples(hostname, reqclass).append(secs)
+
+    def percentile(self, hostname, reqclass, pct):
+        with self.lock:
+            samples = sorted(self.get_samples(hostname, reqclass))
+
+        if len(samples) < self.min_samples:
+            return None
+
+        idx = min(len(samples) - 1, int(len(samples) * pct / 100.0))
+        return samples[idx]
+
+tracker = LatencyTracker()
+
+def record(hostname, reqclass, secs):
+    tracker.record(hostname, reqclass, secs)
+
+def percentile(hostname, reqclass, pct):
+    return tracker.percentile(hostname, reqclass, pct)
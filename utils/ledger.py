@@ -0,0 +1,89 @@
+import os
+import json
+import time
+import logging
+import datetime
+import threading
+
+# a day leaves the ledger once it is retried max_attempts times or has
+# been in it for max_age_days, whichever comes first
+MAX_ATTEMPTS = 5
+MAX_AGE_DAYS = 30
+
+class RetryLedger:
+    def __init__(self, filepath, max_attempts = MAX_ATTEMPTS, \
+                 max_age_days = MAX_AGE_DAYS):
+        self.filepath     = filepath
+        self.max_attempts = max_attempts
+        self.max_age_secs = max_age_days * 24 * 3600
+        # reentrant as the SIGTERM checkpoint may interrupt a holder
+        self.lock     = threading.RLock()
+        self.logger   = logging.getLogger('crawler.ledger')
+        self.days     = self.load()
+
+    def load(self):
+        if not os.path.exists(self.filepath):
+            return {}
+
+        try:
+            with open(self.filepath, 'r') as f:
+                d = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning('Could not read ledger %s: %s', self.filepath, e)
+            return {}
+
+        if 'days' in d:
+            return d['days']
+
+        # ledgers written before the attempts were counted
+        now = time.time()
+        return dict((datestr, {'added': now, 'attempts': 0}) \
+                    for datestr in d.get('dates', []))
+
+    def save(self):
+        tmppath = '%s.tmp' % self.filepath
+        with open(tmppath, 'w') as f:
+            json.dump({'days': self.days}, f, indent = 1, sort_keys = True)
+        os.replace(tmppath, self.filepath)
+
+    def add(self, dateobj):
+        with self.lock:
+            datestr = dateobj.isoformat()
+            if datestr not in self.days:
+                self.days[datestr] = {'added': time.time(), 'attempts': 0}
+                self.save()
+
+    def add_attempt(self, dateobj):
+        with self.lock:
+            datestr = dateobj.isoformat()
+            if datestr in self.days:
+                self.days[datestr]['attempts'] += 1
+                self.save()
+
+    def remove(self, dateobj):
+        with self.lock:
+            datestr = dateobj.isoformat()
+            if datestr in self.days:
+                del self.days[datestr]
+                self.save()
+
+    def expire(self):
+        now = time.time()
+        expired = []
+        for datestr, info in self.days.items():
+            if info['attempts'] >= self.max_attempts or \
+                    now - info['added'] >= self.max_age_secs:
+                expired.append(datestr)
+
+        for datestr in expired:
+            self.logger.warning('Giving up on day %s after %d attempts', \
+                                datestr, self.days[datestr]['attempts'])
+            del self.days[datestr]
+        if expired:
+            self.save()
+
+    def get_dates(self):
+        with self.lock:
+            self.expire()
+            dates = sorted(self.days)
+        return [datetime.date.fromisoformat(d) for d in dates]
@@ -0,0 +1,92 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# rough in-memory size of a parsed tree relative to its html
+PARSED_FACTOR = 8
+
+class PageCache:
+    def __init__(self, max_bytes = 64 * 1024 * 1024, ttl_secs = 3600):
+        self.max_bytes = max_bytes
+        self.ttl_secs  = ttl_secs
+
+        self.entries  = OrderedDict()
+        self.total    = 0
+        self.loading  = {}
+        self.lock     = threading.Lock()
+        self.pid      = os.getpid()
+
+    def check_pid(self):
+        if self.pid != os.getpid():
+            self.entries = OrderedDict()
+            self.total   = 0
+            self.loading = {}
+            self.pid     = os.getpid()
+
+    def lookup(self, key):
+        if key not in self.entries:
+            return None
+
+        expiry, size, value = self.entries[key]
+        if expiry < time.time():
+            del self.entries[key]
+            self.total -= size
+            return None
+
+        self.entries.move_to_end(key)
+        return value
+
+    def store(self, key, value, size):
+        if size > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self.total -= self.entries.pop(key)[1]
+
+        while self.entries and self.total + size > self.max_bytes:
+            oldkey, (expiry, oldsize, oldvalue) = self.entries.popitem(last = False)
+            self.total -= oldsize
+
+        self.entries[key] = (time.time() + self.ttl_secs, size, value)
+        self.total += size
+
+    def get(self, key, loader):
+        # loader returns (value, size); a None value is not cached. Threads
+        # asking for a page that is being fetched wait for that fetch.
+        while True:
+            with self.lock:
+                self.check_pid()
+                value = self.lookup(key)
+                if value != None:
+                    return value
+
+                event = self.loading.get(key)
+                if event == None:
+                    event = threading.Event()
+                    self.loading[key] = event
+                    break
+            event.wait()
+            with self.lock:
+                value = self.lookup(key)
+                if value != None:
+                    return value
+                if key not in self.loading:
+                    # the other fetch failed, do not pile on it
+                    return None
+
+        try:
+            value, size = loader()
+            with self.lock:
+                if value != None:
+                    self.store(key, value, size)
+        finally:
+            with self.lock:
+                del self.loading[key]
+            event.set()
+        return value
+
+cache = PageCache()
+
+def get(key, loader):
+    return cache.get(key, loader)
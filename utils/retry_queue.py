@@ -0,0 +1,92 @@
+import time
+import heapq
+import random
+import logging
+import threading
+
+class RetryLater(Exception):
+    pass
+
+def get_backoff(attempt, base_secs, max_secs):
+    # full jitter so that parked work on the same host does not come back
+    # in lockstep
+    return random.uniform(0, min(max_secs, base_secs * (2 ** attempt)))
+
+class RetryQueue:
+    def __init__(self, base_secs, max_secs, max_attempts):
+        self.base_secs    = base_secs
+        self.max_secs     = max_secs
+        self.max_attempts = max_attempts
+
+        self.heap   = []
+        self.seq    = 0
+        self.lock   = threading.Lock()
+        self.logger = logging.getLogger('crawler.retries')
+
+    def __len__(self):
+        with self.lock:
+            return len(self.heap)
+
+    def park(self, func, args, attempt, giveup):
+        if attempt >= self.max_attempts:
+            self.logger.warning('Giving up on %s%s after %d attempts', \
+                                func.__name__, args, attempt)
+            if giveup != None:
+                giveup(*args)
+            return
+
+        delay = get_backoff(attempt, self.base_secs, self.max_secs)
+        with self.lock:
+            self.seq += 1
+            heapq.heappush(self.heap, (time.time() + delay, self.seq, \
+                                       func, args, attempt, giveup))
+
+    def attempt(self, func, args, attempt, giveup):
+        try:
+            return [func(*args)]
+        except RetryLater as e:
+            self.logger.info('Parking %s%s: %s', func.__name__, args, e)
+            self.park(func, args, attempt + 1, giveup)
+        return []
+
+    def submit(self, func, args, giveup = None):
+        return self.attempt(func, args, 0, giveup)
+
+    def pop_ready(self):
+        with self.lock:
+            if self.heap and self.heap[0][0] <= time.time():
+                return heapq.heappop(self.heap)
+        return None
+
+    def next_ready_in(self):
+        with self.lock:
+            if not self.heap:
+                return None
+            return max(0, self.heap[0][0] - time.time())
+
+    def run_ready(self):
+        results = []
+        while True:
+            item = self.pop_ready()
+            if item == None:
+                break
+            next_ts, seq, func, args, attempt, giveup = item
+            results.extend(self.attempt(func, args, attempt, giveup))
+        return results
+
+    def drain(self, event = None):
+        results = []
+        while True:
+            results.extend(self.run_ready())
+
+            wait = self.next_ready_in()
+            if wait == None:
+                break
+
+            if event == None:
+                time.sleep(wait)
+            elif event.wait(wait):
+                self.logger.warning('Leaving %d parked items as the timer event is set', \
+                                    len(self))
+                break
+        return results
@@ -0,0 +1,183 @@
+import time
+import threading
+import multiprocessing
+from contextlib import contextmanager
+
+class Cancelled(Exception):
+    pass
+
+class Outcome:
+    def __init__(self):
+        self.status  = None
+        self.latency = None
+        self.failed  = False
+
+class HostSlots:
+    def __init__(self, max_per_host):
+        self.max_per_host = max_per_host
+        self.semaphores   = {}
+        self.lock         = threading.Lock()
+
+    def get_semaphore(self, hostname):
+        with self.lock:
+            if hostname not in self.semaphores:
+                self.semaphores[hostname] = \
+                        threading.BoundedSemaphore(self.max_per_host)
+            return self.semaphores[hostname]
+
+    @contextmanager
+    def slot(self, hostname, event = None):
+        semaphore = self.get_semaphore(hostname)
+        # a stop is noticed within a second instead of after the holders
+        while not semaphore.acquire(timeout = 1.0):
+            if event != None and event.is_set():
+                raise Cancelled(hostname)
+        try:
+            yield Outcome()
+        finally:
+            semaphore.release()
+
+# indices into the shared per-host state
+RATE, TOKENS, LAST_REFILL, INFLIGHT, LIMIT, LATENCY, LAST_DECREASE = range(7)
+
+class AdaptiveLimiter:
+    """Token bucket per hostname whose refill rate and concurrency window
+    are tuned with AIMD: they grow while responses are healthy and are cut
+    multiplicatively on 403/503/504, errors or latency spikes. The state is
+    in shared memory so it is common to all crawler processes started
+    after the limiter is created.
+    """
+    def __init__(self, hostnames, max_per_host, start_rate = 1.0, \
+                 min_rate = 0.05, max_rate = 10.0, rate_step = 0.1, \
+                 decrease = 0.5, spike_factor = 3.0):
+        self.max_per_host = max_per_host
+        self.start_rate   = start_rate
+        self.min_rate     = min_rate
+        self.max_rate     = max_rate
+        self.rate_step    = rate_step
+        self.decrease     = decrease
+        self.spike_factor = spike_factor
+        self.throttle_codes = set([403, 503, 504])
+
+        self.states = {}
+        for hostname in set(hostnames):
+            self.states[hostname] = self.new_state()
+
+        self.local_lock = threading.Lock()
+
+    def __getstate__(self):
+        # the shared states go to the crawler processes as they start, the
+        # lock of this process does not
+        state = self.__dict__.copy()
+        del state['local_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local_lock = threading.Lock()
+
+    def new_state(self):
+        values = multiprocessing.RawArray('d', 7)
+        values[RATE]        = self.start_rate
+        values[TOKENS]      = 1.0
+        values[LAST_REFILL] = time.time()
+        values[INFLIGHT]    = 0
+        values[LIMIT]       = 1.0
+        values[LATENCY]     = 0.0
+        values[LAST_DECREASE] = 0.0
+        return (multiprocessing.Lock(), values)
+
+    def get_state(self, hostname):
+        if hostname not in self.states:
+            # hosts not known upfront are only limited within this process
+            with self.local_lock:
+                if hostname not in self.states:
+                    self.states[hostname] = self.new_state()
+        return self.states[hostname]
+
+    def try_acquire(self, values):
+        now = time.time()
+        burst = max(1.0, values[LIMIT])
+        values[TOKENS] = min(burst, values[TOKENS] + \
+                             values[RATE] * (now - values[LAST_REFILL]))
+        values[LAST_REFILL] = now
+
+        if values[INFLIGHT] < int(values[LIMIT]) and values[TOKENS] >= 1.0:
+            values[TOKENS]   -= 1.0
+            values[INFLIGHT] += 1
+            return 0
+
+        if values[TOKENS] < 1.0:
+            return (1.0 - values[TOKENS]) / values[RATE]
+        return 0.05
+
+    def acquire(self, hostname, event = None):
+        lock, values = self.get_state(hostname)
+        while True:
+            with lock:
+                wait = self.try_acquire(values)
+            if wait <= 0:
+                return
+            if event == None:
+                time.sleep(min(wait, 1.0))
+            elif event.wait(min(wait, 1.0)):
+                raise Cancelled(hostname)
+
+    def is_unhealthy(self, values, outcome):
+        if outcome.failed or outcome.status in self.throttle_codes:
+            return True
+
+        avg = values[LATENCY]
+        if outcome.latency != None and avg > 0 and \
+                outcome.latency > self.spike_factor * avg:
+            return True
+        return False
+
+    def release(self, hostname, outcome):
+        lock, values = self.get_state(hostname)
+        with lock:
+            values[INFLIGHT] = max(0, values[INFLIGHT] - 1)
+
+            now = time.time()
+            if self.is_unhealthy(values, outcome):
+                # cut at most once per round trip so that a burst of
+                # failures from one window is not counted many times
+                if now - values[LAST_DECREASE] >= max(values[LATENCY], 1.0):
+                    values[LIMIT] = max(1.0, values[LIMIT] * self.decrease)
+                    values[RATE]  = max(self.min_rate, \
+                                        values[RATE] * self.decrease)
+                    values[LAST_DECREASE] = now
+            else:
+                values[LIMIT] = min(self.max_per_host, \
+                                    values[LIMIT] + 1.0 / values[LIMIT])
+                values[RATE]  = min(self.max_rate, \
+                                    values[RATE] + self.rate_step)
+
+            if outcome.latency != None and not outcome.failed:
+                if values[LATENCY] <= 0:
+                    values[LATENCY] = outcome.latency
+                else:
+                    values[LATENCY] = 0.8 * values[LATENCY] + \
+                                      0.2 * outcome.latency
+
+    def get_stats(self, hostname):
+        lock, values = self.get_state(hostname)
+        with lock:
+            return {'rate': values[RATE], 'limit': int(values[LIMIT]), \
+                    'inflight': int(values[INFLIGHT]), \
+                    'latency': values[LATENCY]}
+
+    @contextmanager
+    def slot(self, hostname, event = None):
+        self.acquire(hostname, event)
+        outcome = Outcome()
+        start   = time.time()
+        try:
+            yield outcome
+        except Exception:
+            outcome.failed = True
+            raise
+        finally:
+            if outcome.latency == None and not outcome.failed:
+                outcome.latency = time.time() - start
+            self.release(hostname, outcome)
@@ -13,6 +13,8 @@ from xml.parsers.expat import ExpatError
 from xml.dom import minidom, Node
 from bs4 import BeautifulSoup, NavigableString, Tag
 
+from . import fast_html
+
 def parse_xml(xmlpage):
     try: 
         d = minidom.parseString(xmlpage)
@@ -171,13 +173,30 @@ def parse_datestr(datestr):
 
     return None         
 
+# the lxml backend of fast_html, other parser names are BeautifulSoup
+# tree builders
+FAST_HTML = 'fast_html'
+
 def parse_webpage(webpage, parser):
+    if parser == FAST_HTML:
+        return fast_html.parse_webpage(webpage)
+
     try:
         d = BeautifulSoup(webpage, parser)
         return d
     except:
         return None
 
+def parse_tables(webpage, attrs, parser):
+    # fast_html drops the tables not matching attrs while parsing
+    if parser == FAST_HTML:
+        return fast_html.parse_tables(webpage, attrs)
+
+    d = parse_webpage(webpage, parser)
+    if not d:
+        return None
+    return d.find_all('table', attrs)
+
 def url_to_filename(url, catchpath, catchquery):
     htuple = urllib.parse.urlparse(url)
     path   = htuple[2]
@@ -211,6 +230,9 @@ def url_to_filename(url, catchpath, catchquery):
     return None
 
 def get_tag_contents(node):
+    if isinstance(node, fast_html.Tag):
+        return node.get_contents()
+
     if type(node) == NavigableString:
         return '%s' % node 
 
@@ -1,12 +1,24 @@
 from xml.sax import saxutils
-from xml.parsers.expat import ExpatError
 import types
 import datetime
 import logging
 import codecs
-from xml.dom import minidom, Node
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from lxml import etree
+
 from .utils import MetaInfo
 
+# lxml parsers are not to be shared across threads
+parsers = threading.local()
+
+def get_parser():
+    if not hasattr(parsers, 'parser'):
+        parsers.parser = etree.XMLParser(resolve_entities = False, \
+                                         no_network = True, huge_tree = True)
+    return parsers.parser
+
 def print_tag_file(filepath, feature):
     filehandle = codecs.open(filepath, 'w', 'utf8')
 
@@ -16,14 +28,25 @@ def print_tag_file(filepath, feature):
     filehandle.close()
 
 def read_tag_file(filepath, relurl):
-    filehandle = codecs.open(filepath, 'r', 'utf8')
-
-    metastring = filehandle.read()
-    metainfo = xml_to_tagdict(relurl, metastring.encode('utf-8'))
-
-    filehandle.close()
-
-    return metainfo
+    with open(filepath, 'rb') as filehandle:
+        metastring = filehandle.read()
+
+    return xml_to_tagdict(relurl, metastring)
+
+def read_tag_files(items, num_threads = 8):
+    # items are (filepath, relurl) pairs, the metainfos are returned in the
+    # same order with None for the files that could not be read
+    def read_one(item):
+        filepath, relurl = item
+        try:
+            return read_tag_file(filepath, relurl)
+        except OSError as e:
+            logger = logging.getLogger('utils.commonfuncs')
+            logger.error('Err %s in reading of tagfile %s' % (e, relurl))
+            return None
+
+    with ThreadPoolExecutor(max_workers = num_threads) as executor:
+        return list(executor.map(read_one, items))
 
 def obj_to_xml(tagName, obj):
     if type(obj) in (str,):
@@ -57,13 +80,13 @@ def obj_to_xml(tagName, obj):
 
 def xml_to_tagdict(docid, xmlstring):
     try:
-        xmlnode = minidom.parseString(xmlstring)
-    except ExpatError as e:
+        xmlnode = etree.fromstring(xmlstring, get_parser())
+    except etree.XMLSyntaxError as e:
         logger = logging.getLogger('utils.commonfuncs')
         logger.error('Err %s in xml reading of tagfile  %s' % (e, docid))
         return None
 
-    feature = xml_to_obj(xmlnode.childNodes[0])
+    feature = xml_to_obj(xmlnode)
     metainfo = MetaInfo()
     for k, v in feature.items():
         if k == 'date':
@@ -76,9 +99,9 @@ def xml_to_tagdict(docid, xmlstring):
 
 def xml_to_obj(xmlNode):
     xmldict = {}
-    for node in xmlNode.childNodes:
-        if node.nodeType == Node.ELEMENT_NODE:
-           k = node.tagName
+    for node in xmlNode:
+        if isinstance(node.tag, str):
+           k = node.tag
            obj = xml_to_obj(node)
            if k in xmldict:
                if not (type(xmldict[k]) == list):
@@ -90,7 +113,7 @@ def xml_to_obj(xmlNode):
     if xmldict:
         return xmldict
     else:
-        return get_node_value(xmlNode.childNodes)
+        return get_node_value(xmlNode)
 
 def get_xml_tag(tagName, tagValue, escape = True):
     if type(tagValue) == int:
@@ -116,12 +139,12 @@ def date_to_xml(dateobj):
 
     return datedict
 
-def get_node_value(xmlNodes):
+def get_node_value(xmlNode):
+    # text split by comments comes as the tails of the comments
     value = []
     ignoreValues = ['\n']
-    for node in xmlNodes:
-        if node.nodeType == Node.TEXT_NODE:
-            if node.data not in ignoreValues:
-                value.append(node.data)
+    texts = [xmlNode.text] + [node.tail for node in xmlNode]
+    for text in texts:
+        if text and text not in ignoreValues:
+            value.append(text)
     return ''.join(value)
-